@@ -1,10 +1,15 @@
 import streamlit as st
 import os
-import subprocess
+import sys
 import json
 import streamlit.components.v1 as components
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+import pipeline
+from jobs import DONE, FAILED, QUEUED, RUNNING, get_runner
+from workspace import save_upload, workspace_name
+
 st.title("📚 Citation Reference Processor")
 
 st.header("Select or Upload Article")
@@ -25,25 +30,76 @@ article_path = None
 article_base = None
 
 if uploaded_file is not None:
-    # Use uploaded file and save it
+    # Uploads are stored by content hash (see scripts/workspace.py), never over articles/
     filename = uploaded_file.name
-    article_base = filename.replace(".txt", "")
-    article_path = os.path.join(articles_dir, filename)
-    with open(article_path, "wb") as f:
-        f.write(uploaded_file.read())
+    article_path = save_upload(filename, uploaded_file.getvalue())
     st.success(f"Uploaded and saved {filename}")
 
 elif selected_file and selected_file != "-- Choose an article --":
     # Use selected existing file
     article_path = os.path.join(articles_dir, selected_file)
-    article_base = selected_file.replace(".txt", "")
     st.info(f"Using existing article: {selected_file}")
 
 else:
     st.warning("Please upload a new article or select an existing one.")
 
+# --- Background jobs ---
+# Steps run on the shared job runner (scripts/jobs.py); these functions run in its worker
+# threads, so they only call the pipeline and report through job.update(), never st.*.
+def keywords_job(job, article_path, article_base, candidates, diversity, force):
+    job.update(message="Extracting keywords")
+    return pipeline.run_extract_keywords(article_path, article_base, candidates=candidates,
+                                         diversity=diversity, force=force)
+
+
+def fetch_job(job, article_base, keyword_group, max_results, batch_size, enrich, budget, force):
+    keywords = pipeline.load_json(pipeline.keywords_path(article_base)).get(keyword_group, [])
+    total = max(1, len(keywords) * len(pipeline.SOURCES))
+    finished = []
+
+    def on_result(source, keyword_to_refs):
+        found = pipeline.keyword_items(keyword_to_refs)
+        finished.extend(kw for kw, _ in found)
+        job.update(progress=0.8 * len(finished) / total,
+                   message=f"{len(finished)} of {total} keyword/source searches done",
+                   items=[f"- **{source}** · {kw}: {ref.title}" for kw, refs in found for ref in refs])
+
+    job.update(message="Fetching references")
+    results = pipeline.run_fetch_references(
+        article_base, keyword_group, max_results=max_results, batch_size=batch_size, enrich=enrich,
+        budget=budget, on_result=on_result, force=force,
+    )
+    # One record per paper across sources and keywords, used as the "merged" engine
+    job.update(progress=0.85, message="Deduplicating")
+    merged = pipeline.run_deduplicate(article_base, keyword_group, force=force)
+    job.update(progress=0.9, message="Drawing diagrams")
+    diagrams = pipeline.run_diagrams(article_base, keyword_group, force=force)
+    return {
+        "incomplete": {source: pipeline.incomplete_keywords(refs) for source, refs in results.items()},
+        "total": sum(len(refs) for source_refs in results.values() for _, refs in pipeline.keyword_items(source_refs)),
+        "unique": sum(len(refs) for refs in merged.values()),
+        "diagrams": diagrams,
+    }
+
+
+def format_job(job, article_base, keyword_group, force):
+    job.update(message="Formatting citations")
+    return pipeline.run_format_citations(article_base, keyword_group, force=force)
+
+
+def bibtex_job(job, article_base, keyword_group, force):
+    job.update(message="Writing BibTeX")
+    return pipeline.run_export_bibtex(article_base, keyword_group, force=force)
+
+
+def pipeline_graph_job(job, article_path, article_base, force):
+    job.update(message="Drawing the pipeline graph")
+    return pipeline.run_pipeline_graph(article_path, article_base, force=force)
+
+
 # Only proceed if we have an article_path (either uploaded or selected)
 if article_path is not None:
+    runner = get_runner()
 
     # Initialize session state flags if not present
     if "keywords_extracted" not in st.session_state:
@@ -52,24 +108,61 @@ if article_path is not None:
         st.session_state.references_fetched = False
     if "citations_formatted" not in st.session_state:
         st.session_state.citations_formatted = False
-
-
-    # Extract Keywords button callback
-    def extract_keywords():
-        output_path = f"keywords/{article_base}_keywords.json"
-        os.makedirs("keywords", exist_ok=True)
-        subprocess.run([
-            "python", "scripts/extract_keywords.py",
-            article_path, output_path
-        ])
+    if "jobs" not in st.session_state:
+        st.session_state.jobs = {}  # "<article>:<step>" -> id of the job this session started
+        st.session_state.jobs_seen = set()  # finished jobs of this session
+    # Jobs that finished since the last run: their messages are shown once, like a button's
+    just_finished = st.session_state.pop("just_finished", set())
+
+    def start_job(step, fn, *args, params=None):
+        # Several sessions asking for the same step with the same params share one job
+        job = runner.submit(article_base, step, fn, *args, params=params)
+        st.session_state.jobs[f"{article_base}:{step}"] = job.id
+
+    def session_job(step):
+        job_id = st.session_state.jobs.get(f"{article_base}:{step}")
+        job = runner.get(job_id) if job_id else None
+        if job is None:
+            return None
+        snapshot = job.snapshot()
+        snapshot["new"] = job_id in just_finished
+        if snapshot["new"] and snapshot["status"] == FAILED:
+            st.error(f"{step.replace('_', ' ').title()} failed: {snapshot['error']}")
+        return snapshot
+
+    # Progress of running jobs, drawn at the top but filled in once the buttons below have run
+    job_status = st.container()
+
+    # Steps skip work whose inputs are unchanged (see pipeline.StageManifest) unless forced
+    force_rerun = st.checkbox("Recompute steps even if their inputs are unchanged")
+    candidate_labels = {
+        "rake_yake": "RAKE and YAKE phrases",
+        "ngrams": "N-grams from the whole article (higher recall)",
+        "noun_phrases": "Noun phrases from the whole article",
+    }
+    candidates = st.selectbox("Candidates scored for BERT keywords:", list(candidate_labels),
+                              format_func=candidate_labels.get)
+    diverse_keywords = st.checkbox("Diversify BERT keywords (MMR)")
+    diversity = 0.5 if diverse_keywords else None
+
+    # All outputs are keyed by this workspace: same file name and keyword settings -> same
+    # workspace, shared with every session that has them. Edits to the text keep the workspace;
+    # the stage manifest reruns only the steps whose inputs changed.
+    article_base = workspace_name(article_path, {"candidates": candidates, "diversity": diversity})
+
+    if st.button("Extract Keywords"):
+        start_job("keywords", keywords_job, article_path, article_base, candidates, diversity, force_rerun,
+                  params={"candidates": candidates, "diversity": diversity, "force": force_rerun})
+
+    job = session_job("keywords")
+    if job is not None and job["status"] == DONE:
+        if job["new"]:
+            st.success("✅ Keywords extracted.")
         st.session_state.keywords_extracted = True
 
-    if st.button("Extract Keywords", on_click=extract_keywords):
-        st.success("✅ Keywords extracted.")
-
-    # Show keywords if extracted
-    if st.session_state.keywords_extracted:
-        output_path = f"keywords/{article_base}_keywords.json"
+    # Show keywords if extracted; keywords another session computed for this workspace show right away
+    output_path = pipeline.keywords_path(article_base)
+    if st.session_state.keywords_extracted or os.path.exists(output_path):
         if os.path.exists(output_path):
             with open(output_path, "r", encoding="utf-8") as f:
                 keywords = json.load(f)
@@ -81,49 +174,42 @@ if article_path is not None:
     # --- Select keyword extraction method ---
     keyword_options = ["rake", "yake", "bert_score"]
     selected_keyword_group = st.selectbox("Select keyword group for reference search:", keyword_options)
+    max_results = st.number_input("Results per keyword:", min_value=1, max_value=1000, value=2)
+    batch_queries = st.checkbox("Batch keywords into fewer requests (OpenAlex) and enrich DOIs via Semantic Scholar")
+    latency_budget = st.number_input("Latency budget in seconds (0 = wait for every source):", min_value=0.0, value=0.0)
+
+    # Fetch References: references are listed as each keyword/source completes, then
+    # deduplicated and drawn
+    if st.button("Fetch References"):
+        fetch_params = {
+            "group": selected_keyword_group, "max_results": int(max_results),
+            "batch_size": 5 if batch_queries else 1, "enrich": batch_queries,
+            "budget": latency_budget or None, "force": force_rerun,
+        }
+        start_job("fetch", fetch_job, article_base, selected_keyword_group, fetch_params["max_results"],
+                  fetch_params["batch_size"], fetch_params["enrich"], fetch_params["budget"], force_rerun,
+                  params=fetch_params)
 
-    # Fetch References button callback
-    def fetch_references():
-        os.makedirs("references_raw", exist_ok=True)
-        sources = ["openalex", "semanticscholar", "crossref"]
-
-        for source in sources:
-            ref_path = f"references_raw/{article_base}_references_{source}_{selected_keyword_group}.json"
-            subprocess.run([
-                "python", "scripts/fetch_references.py",
-                f"keywords/{article_base}_keywords.json",
-                ref_path,
-                source,
-                selected_keyword_group
-            ])
-        
+    job = session_job("fetch")
+    if job is not None and job["status"] == DONE:
         st.session_state.references_fetched = True
         st.session_state.diagram_rendered = True
-
-
-    if st.button("Fetch References", on_click=fetch_references):
+    if job is not None and job["status"] == DONE and job["new"]:
+        summary = job["result"]
         st.success("✅ References fetched.")
-
-        # Generate and display diagrams immediately after fetching
-        for source in ["openalex", "semanticscholar", "crossref"]:
-            ref_path = f"references_raw/{article_base}_references_{source}_{selected_keyword_group}.json"
-            diagram_path = f"diagrams/{article_base}_{source}_{selected_keyword_group}_plotly.html"
-            os.makedirs("diagrams", exist_ok=True)
-
-            if os.path.exists(ref_path):
-                subprocess.run([
-                    "python", "scripts/generate_diagram.py",
-                    ref_path,
-                    diagram_path
-                ])
-            else:
+        for source, incomplete in summary["incomplete"].items():
+            if incomplete:
+                st.warning(f"{source.title()} is missing results for: {', '.join(incomplete)} (fetch again to retry only these)")
+        st.info(f"{summary['unique']} unique papers among {summary['total']} fetched references.")
+        for source in pipeline.OUTPUT_ENGINES:
+            if source not in summary["diagrams"]:
                 st.warning(f"References for {source.title()} not found, cannot generate diagram.")
-    
+
         # Persist and show diagrams if already rendered
     if st.session_state.get("diagram_rendered", False):
         st.markdown("## 📊 Citation Diagrams")
-        for source in ["openalex", "semanticscholar", "crossref"]:
-            diagram_path = f"diagrams/{article_base}_{source}_{selected_keyword_group}_plotly.html"
+        for source in pipeline.OUTPUT_ENGINES:
+            diagram_path = pipeline.diagram_path(article_base, source, selected_keyword_group)
             if os.path.exists(diagram_path):
                 st.markdown(f"### {source.title()} Citation Diagram")
                 with open(diagram_path, "r", encoding="utf-8") as f:
@@ -132,73 +218,73 @@ if article_path is not None:
             else:
                 st.warning(f"Diagram for {source.title()} not found.")
 
-    # Format Citations button callback
-    def format_citations():
-        os.makedirs("citations_formatted", exist_ok=True)
-        engines = ["openalex", "semanticscholar", "crossref"]
-        for engine in engines:
-            subprocess.run([
-                "python", "scripts/format_citations.py",
-                f"references_raw/{article_base}_references_{engine}_{selected_keyword_group}.json",
-                f"citations_formatted/{article_base}_{engine}_{selected_keyword_group}"
-            ])
+    if st.button("Format Citations"):
+        start_job("citations", format_job, article_base, selected_keyword_group, force_rerun,
+                  params={"group": selected_keyword_group, "force": force_rerun})
+
+    job = session_job("citations")
+    if job is not None and job["status"] == DONE:
+        if job["new"]:
+            st.success("✅ Citations formatted.")
         st.session_state.citations_formatted = True
 
         # Save formatted file paths in session_state for later use
-        st.session_state["formatted_files"] = {
-            engine: {
-                "apa": f"citations_formatted/{article_base}_{engine}_{selected_keyword_group}_apa.txt",
-                "mla": f"citations_formatted/{article_base}_{engine}_{selected_keyword_group}_mla.txt",
-                "chicago": f"citations_formatted/{article_base}_{engine}_{selected_keyword_group}_chicago.txt",
-            } for engine in engines
-        }
-
-    if st.button("Format Citations", on_click=format_citations):
-        st.success("✅ Citations formatted.")
+        st.session_state["formatted_files"] = job["result"]
 
     # View formatted citations if available
     if "formatted_files" in st.session_state and st.session_state.citations_formatted:
         st.markdown("### 📖 View Formatted Citations")
-        engine = st.selectbox("Select Engine", ["openalex", "semanticscholar", "crossref"])
-        format_type = st.selectbox("Select Format", ["apa", "mla", "chicago"])
-        selected_file = st.session_state["formatted_files"][engine][format_type]
+        engine = st.selectbox("Select Engine", pipeline.OUTPUT_ENGINES)
+        format_type = st.selectbox("Select Format", pipeline.CITATION_FORMATS)
+        selected_file = st.session_state["formatted_files"].get(engine, {}).get(format_type, "")
         if os.path.exists(selected_file):
             with open(selected_file, "r", encoding="utf-8") as f:
                 st.text_area(f"{engine.title()} - {format_type.upper()} Citation", f.read(), height=300)
         else:
             st.warning("Citation file not found. Did you run formatting first?")
 
-    # Export BibTeX button callback
-    def export_bibtex():
-        for engine in ["openalex", "semanticscholar", "crossref"]:
-            subprocess.run([
-                "python", "scripts/json_to_bibtex.py",
-                f"references_raw/{article_base}_references_{engine}_{selected_keyword_group}.json",
-                f"citations_formatted/{article_base}_{engine}_{selected_keyword_group}.bib"
-            ])
+    if st.button("Export BibTeX"):
+        start_job("bibtex", bibtex_job, article_base, selected_keyword_group, force_rerun,
+                  params={"group": selected_keyword_group, "force": force_rerun})
 
-    if st.button("Export BibTeX", on_click=export_bibtex):
+    job = session_job("bibtex")
+    if job is not None and job["status"] == DONE and job["new"]:
         st.success("✅ BibTeX files generated.")
 
     if article_path and article_base:
         st.header("📌 Keyword Extraction and Reference Matching Diagram")
 
         if st.button("🧩 Generate Full Diagram"):
-            output_path = f"diagrams/{article_base}_pipeline.html"
-
-            try:
-                result = subprocess.run(
-                    ["python", "scripts/generate_pipeline_graph.py", article_path, output_path, selected_keyword_group],
-                    check=True,
-                    capture_output=True,
-                    text=True,
-                )
-                st.success("Diagram successfully generated.")
-                st.code(result.stdout)
-
-                with open(output_path, "r", encoding="utf-8") as f:
-                    st.components.v1.html(f.read(), height=800, scrolling=True)
-
-            except subprocess.CalledProcessError as e:
-                st.error("An error occurred while generating the diagram.")
-                st.code(e.stderr)
+            start_job("pipeline_graph", pipeline_graph_job, article_path, article_base, force_rerun,
+                      params={"force": force_rerun})
+
+        job = session_job("pipeline_graph")
+        if job is not None and job["status"] == DONE and job["new"]:
+            st.success("Diagram successfully generated.")
+            with open(job["result"], "r", encoding="utf-8") as f:
+                st.components.v1.html(f.read(), height=800, scrolling=True)
+
+    # Polls while any job of this article is queued or running (from this session or another
+    # one), and reruns the page once one of this session's jobs has finished so its results show.
+    polling = any(job.active for job in runner.jobs(article_base))
+
+    @st.fragment(run_every=1.0 if polling else None)
+    def show_jobs():
+        mine = set(st.session_state.jobs.values())
+        for job in runner.jobs(article_base):
+            job = job.snapshot()
+            if job["status"] in (QUEUED, RUNNING):
+                label = job["step"].replace("_", " ").title()
+                owner = "" if job["id"] in mine else " (started in another session)"
+                text = f"{label}{owner}: {job['message'] or job['status']}"
+                st.progress(job["progress"], text=text)
+                if job["items"]:
+                    st.markdown("\n".join(job["items"][-30:]))
+        finished = {job.id for job in runner.jobs(article_base) if job.id in mine and not job.active}
+        if finished - st.session_state.jobs_seen:
+            st.session_state.just_finished = finished - st.session_state.jobs_seen
+            st.session_state.jobs_seen |= finished
+            st.rerun()
+
+    with job_status:
+        show_jobs()
@@ -0,0 +1,177 @@
+"""Batch pipeline runner.
+
+Runs keyword extraction, reference fetching, citation formatting and BibTeX
+export for every article in a directory (or matching a glob) across a pool
+of worker processes, e.g.::
+
+    python scripts/batch_pipeline.py articles/
+    python scripts/batch_pipeline.py "articles/report_*.txt" --workers 8 --groups rake yake
+
+BERT is loaded once, by an embedding service started in this process, and
+shared by all workers. Reference responses go through the shared SQLite cache
+in ``.cache/`` and each worker gets an equal share of the API rate limits.
+"""
+import argparse
+import contextlib
+import glob
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pipeline
+from reference_io import save_json
+
+DEFAULT_LOG_DIR = "logs/batch"
+
+
+def find_articles(target):
+    pattern = os.path.join(target, "*.txt") if os.path.isdir(target) else target
+    return sorted(glob.glob(pattern))
+
+
+def article_base_of(article_path):
+    return os.path.splitext(os.path.basename(article_path))[0]
+
+
+def process_article(article_path, options):
+    # Runs in a worker process; stage output goes to a per-article log instead of the console
+    article_base = article_base_of(article_path)
+    status = {"article": article_base, "path": article_path, "status": "ok", "stage": None,
+              "error": None, "incomplete": {}}
+    start = time.perf_counter()
+    os.makedirs(options["log_dir"], exist_ok=True)
+    log_path = os.path.join(options["log_dir"], f"{article_base}.log")
+
+    with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        try:
+            status["stage"] = "keywords"
+            pipeline.run_extract_keywords(article_path, article_base, options["candidates"], options["diversity"])
+            for group in options["groups"]:
+                status["stage"] = f"fetch:{group}"
+                results = pipeline.run_fetch_references(
+                    article_base, group, options["sources"], options["max_results"],
+                    options["batch_size"], options["enrich"], options["budget"],
+                )
+                missing = {source: pipeline.incomplete_keywords(refs) for source, refs in results.items()}
+                missing = {source: kws for source, kws in missing.items() if kws}
+                if missing:
+                    status["incomplete"][group] = missing
+                    status["status"] = "partial"
+
+                status["stage"] = f"dedup:{group}"
+                pipeline.run_deduplicate(article_base, group, options["sources"])
+                status["stage"] = f"citations:{group}"
+                pipeline.run_format_citations(article_base, group)
+                status["stage"] = f"bibtex:{group}"
+                pipeline.run_export_bibtex(article_base, group)
+            status["stage"] = "done"
+        except Exception as e:
+            traceback.print_exc(file=log)
+            status["status"] = "failed"
+            status["error"] = f"{type(e).__name__}: {e}"
+
+    status["seconds"] = round(time.perf_counter() - start, 2)
+    status["log"] = log_path
+    return status
+
+
+def start_shared_embedder():
+    # Workers reach the model through EMBEDDING_SERVICE_URL instead of each loading their own copy
+    from embeddings import SERVICE_URL_ENV
+    if os.environ.get(SERVICE_URL_ENV):
+        return None
+    from embedding_service import start_background
+    print("Starting shared embedding service...")
+    server, url = start_background()
+    os.environ[SERVICE_URL_ENV] = url
+    return server
+
+
+def run_batch(article_paths, options, workers):
+    os.environ.setdefault("HTTP_RATE_SCALE", str(1.0 / workers))
+    server = start_shared_embedder()
+    statuses = []
+    try:
+        # spawn: workers must not inherit the service threads or the loaded model
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context) as executor:
+            futures = {executor.submit(process_article, path, options): path for path in article_paths}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    status = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    path = futures[future]
+                    status = {"article": article_base_of(path), "path": path, "status": "failed",
+                              "stage": None, "error": f"{type(e).__name__}: {e}", "incomplete": {}}
+                statuses.append(status)
+                if status["error"]:
+                    detail = " ".join(status["error"].split())[:120]
+                else:
+                    detail = ", ".join(f"incomplete {group}" for group in status["incomplete"])
+                print(f"[{done}/{len(futures)}] {status['status']:<7} {status['article']}"
+                      f" ({status.get('seconds', 0):.1f}s){' ' + detail if detail else ''}")
+    finally:
+        if server is not None:
+            server.shutdown()
+    return sorted(statuses, key=lambda s: s["path"])
+
+
+def merge_library(statuses, options, library):
+    # Appends every processed article's references to one .bib; entries it already has are skipped.
+    # Runs in this process once the workers are done, so appends never interleave.
+    for status in statuses:
+        if status["status"] == "failed":
+            continue
+        for group in options["groups"]:
+            pipeline.run_export_bibtex(status["article"], group, library=library)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the full pipeline for many articles in parallel.")
+    parser.add_argument("articles", help="a directory of .txt articles or a glob pattern")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--groups", nargs="+", default=pipeline.KEYWORD_GROUPS, choices=pipeline.KEYWORD_GROUPS)
+    parser.add_argument("--sources", nargs="+", default=pipeline.SOURCES, choices=pipeline.SOURCES)
+    parser.add_argument("--max-results", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--enrich", action="store_true")
+    parser.add_argument("--budget", type=float, default=None, help="per fetch, in seconds")
+    parser.add_argument("--candidates", choices=["rake_yake", "ngrams", "noun_phrases"], default="rake_yake")
+    parser.add_argument("--diversity", type=float, default=None)
+    parser.add_argument("--library", default=None,
+                        help="also merge all references into this consolidated .bib (only new entries are appended)")
+    parser.add_argument("--log-dir", default=DEFAULT_LOG_DIR)
+    parser.add_argument("--report", default=None, help=f"status report JSON (default: {DEFAULT_LOG_DIR}/report.json)")
+    args = parser.parse_args()
+
+    article_paths = find_articles(args.articles)
+    if not article_paths:
+        print(f"No articles found for {args.articles}")
+        sys.exit(1)
+
+    options = {
+        "groups": args.groups, "sources": args.sources, "max_results": args.max_results,
+        "batch_size": args.batch_size, "enrich": args.enrich, "budget": args.budget,
+        "candidates": args.candidates, "diversity": args.diversity, "log_dir": args.log_dir,
+    }
+    workers = max(1, min(args.workers, len(article_paths)))
+    print(f"Processing {len(article_paths)} articles with {workers} workers")
+    start = time.perf_counter()
+    statuses = run_batch(article_paths, options, workers)
+    if args.library:
+        merge_library(statuses, options, args.library)
+
+    counts = {state: sum(s["status"] == state for s in statuses) for state in ("ok", "partial", "failed")}
+    report_path = args.report or os.path.join(args.log_dir, "report.json")
+    save_json(report_path, {"summary": {**counts, "seconds": round(time.perf_counter() - start, 2)},
+                            "articles": statuses})
+    print(f"ok: {counts['ok']}, partial: {counts['partial']}, failed: {counts['failed']} - report in {report_path}")
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
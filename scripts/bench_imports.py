@@ -0,0 +1,60 @@
+"""Cold-start import benchmark for the pipeline scripts.
+
+Each module is imported in a fresh interpreter several times and the median
+wall time is reported, e.g.::
+
+    python scripts/bench_imports.py
+    python scripts/bench_imports.py fetch_references extract_keywords --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MODULES = [
+    "pipeline",
+    "fetch_references",
+    "extract_keywords",
+    "format_citations",
+    "json_to_bibtex",
+]
+
+PROBE = (
+    "import sys, time; sys.path.insert(0, {scripts!r}); "
+    "t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+)
+
+
+def time_import(module, runs):
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(scripts=SCRIPTS_DIR, module=module)],
+            capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the pipeline scripts.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'module':<22}{'median':>10}{'min':>10}{'max':>10}")
+    for module in args.modules:
+        timings, error = time_import(module, args.runs)
+        if timings is None:
+            print(f"{module:<22}  failed: {error}")
+            continue
+        print(f"{module:<22}{statistics.median(timings):>9.3f}s{min(timings):>9.3f}s{max(timings):>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Cross-source reference deduplication.
+
+References are clustered when they share a normalized DOI (hash index) or
+when their normalized titles are near-identical. Title candidates come from
+MinHash signatures split into LSH bands, so only references that share a
+band are ever compared; each candidate pair is then confirmed with the exact
+Jaccard similarity of the title shingles. A title match never joins two
+different DOIs ("... Part I" and "... Part II" stay two papers).
+"""
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+from reference import Reference
+from reference_io import keyword_items
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 bands x 4 rows: titles above ~0.5 Jaccard become candidates
+TITLE_SIMILARITY = 0.8  # exact shingle Jaccard needed to merge two titles
+SHINGLE_SIZE = 3  # bytes of the UTF-8 encoded title
+MIN_TITLE_LENGTH = 12  # shorter titles ("Editorial", "Introduction") only merge by DOI
+MERGED_SOURCE = "merged"
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240501)
+_PERM_A = _rng.integers(1, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def normalize_title(title):
+    if not title:
+        return ""
+    if not title.isascii():
+        title = unicodedata.normalize("NFKD", title)
+        title = "".join(c for c in title if not unicodedata.combining(c))
+    title = title.lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", title).split())
+
+
+def title_shingles(normalized_title):
+    # Sorted unique 3-byte shingles, each packed into one integer, built without a Python loop
+    data = np.frombuffer(f" {normalized_title} ".encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+    return np.unique((data[:-2] << np.uint64(16)) | (data[1:-1] << np.uint64(8)) | data[2:])
+
+
+def minhash(shingles):
+    # (a * h + b) mod p for every permutation and shingle; a < 2^31 and h < 2^24 fit in uint64
+    return ((_PERM_A[:, None] * shingles[None, :] + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+def jaccard(a, b):
+    # a, b: sorted unique shingle arrays
+    if not len(a) or not len(b):
+        return 0.0
+    common = len(np.intersect1d(a, b, assume_unique=True))
+    return common / (len(a) + len(b) - common)
+
+
+class _UnionFind:
+    # dois: the DOI (or None) of every element; a set never holds two different DOIs
+    def __init__(self, dois):
+        self.parent = list(range(len(dois)))
+        self.doi = list(dois)
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        # False if the two sets carry different DOIs and were left apart
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return True
+        if self.doi[i] and self.doi[j] and self.doi[i] != self.doi[j]:
+            return False
+        # The earlier record stays the root, so clusters keep first-seen order
+        root, child = min(i, j), max(i, j)
+        self.parent[child] = root
+        self.doi[root] = self.doi[root] or self.doi[child]
+        return True
+
+
+def _years_compatible(a, b):
+    return not (a.year and b.year and abs(a.year - b.year) > 1)
+
+
+def cluster_references(refs):
+    # refs: [Reference]; returns a cluster root index for every ref
+    clusters = _UnionFind([ref.doi for ref in refs])
+
+    # Exact: hash index on normalized DOI
+    by_doi = {}
+    for i, ref in enumerate(refs):
+        if ref.doi:
+            clusters.union(by_doi.setdefault(ref.doi, i), i)
+
+    # Exact: hash index on normalized title (same year range), so LSH sees each title once
+    by_title = {}
+    candidates = []
+    for i, ref in enumerate(refs):
+        title = normalize_title(ref.title)
+        if len(title) < MIN_TITLE_LENGTH:
+            continue
+        same = by_title.setdefault(title, [])
+        if not any(_years_compatible(refs[i], refs[j]) and clusters.union(j, i) for j in same):
+            same.append(i)
+            candidates.append((i, title))
+
+    # Fuzzy: LSH over title MinHash signatures; only refs sharing a band are compared
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    buckets = {}
+    shingles = {}
+    compared = set()  # a pair colliding in several bands is checked once
+    for i, title in candidates:
+        shingles[i] = title_shingles(title)
+        signature = minhash(shingles[i])
+        for band in range(LSH_BANDS):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            for j in buckets.setdefault(key, []):
+                if (j, i) in compared or clusters.find(i) == clusters.find(j):
+                    continue
+                compared.add((j, i))
+                if _years_compatible(refs[i], refs[j]) and jaccard(shingles[i], shingles[j]) >= TITLE_SIMILARITY:
+                    clusters.union(i, j)
+            buckets[key].append(i)
+
+    return [clusters.find(i) for i in range(len(refs))]
+
+
+def _completeness(ref):
+    return sum(1 for value in (ref.title, ref.authors, ref.year, ref.journal, ref.doi, ref.url, ref.abstract) if value)
+
+
+def merge_records(members):
+    # members: [(source, keyword, Reference)]; the most complete record wins, gaps are
+    # filled from the others, and every (source, keyword) it came from is kept
+    refs = [ref for _, _, ref in members]
+    base = max(refs, key=_completeness)
+    merged = Reference(
+        title=base.title, authors=max((ref.authors for ref in refs), key=len), year=base.year,
+        journal=base.journal, doi=base.doi, url=base.url, abstract=base.abstract, source=MERGED_SOURCE,
+    )
+    for field in ("title", "year", "journal", "doi", "url", "abstract"):
+        if not getattr(merged, field):
+            setattr(merged, field, next((getattr(ref, field) for ref in refs if getattr(ref, field)), None))
+
+    provenance = []
+    for source, keyword, ref in members:
+        for pair in ref.provenance or ((source, keyword),):
+            if pair not in provenance:
+                provenance.append(pair)
+    merged.provenance = tuple(provenance)
+    return merged
+
+
+def deduplicate(references_by_source, keywords=None):
+    # {source: {keyword: [Reference]}} -> {keyword: [merged Reference]}. Each paper is listed once,
+    # under the first keyword (in keyword order) it was found for; its provenance lists them all.
+    members = []
+    for source, keyword_to_refs in references_by_source.items():
+        for keyword, refs in keyword_items(keyword_to_refs):
+            for ref in refs:
+                members.append((source, keyword, Reference.from_dict(ref)))
+
+    keyword_order = list(keywords) if keywords else []
+    for _, keyword, _ in members:
+        if keyword not in keyword_order:
+            keyword_order.append(keyword)
+    rank = {keyword: i for i, keyword in enumerate(keyword_order)}
+
+    roots = cluster_references([ref for _, _, ref in members])
+    clusters = {}
+    for root, member in zip(roots, members):
+        clusters.setdefault(root, []).append(member)
+
+    merged = {keyword: [] for keyword in keyword_order}
+    for cluster in clusters.values():
+        record = merge_records(cluster)
+        first_keyword = min((keyword for _, keyword, _ in cluster), key=rank.__getitem__)
+        merged[first_keyword].append(record)
+    print(f"Deduplicated {len(members)} references into {len(clusters)} unique papers")
+    return merged
+
+
+if __name__ == "__main__":
+    import sys
+    from reference_io import load_references, save_references
+
+    if len(sys.argv) < 3:
+        print("Usage: python dedup.py <output_json_or_ndjson_file> <references_json_or_ndjson_file>...")
+        sys.exit(1)
+
+    output_path = sys.argv[1]
+    references_by_source = {}
+    for path in sys.argv[2:]:
+        # references_raw/<article>_references_<source>_<group>.json
+        match = re.search(r"_references_([a-z]+)_", os.path.basename(path))
+        references_by_source[match.group(1) if match else path] = load_references(path)
+    save_references(output_path, deduplicate(references_by_source))
+    print(f"Merged references saved to {output_path}")
+
+# python scripts/dedup.py references_raw/article_1_references_merged_rake.json references_raw/article_1_references_*_rake.json
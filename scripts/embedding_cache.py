@@ -0,0 +1,189 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = ".cache/embeddings"
+DEFAULT_CAPACITY = 50000  # vectors; the memmap file is capacity * dim * 4 bytes (sparse until used)
+
+
+def normalize_text(text, model_name):
+    text = " ".join(str(text).split())
+    # Uncased models lowercase their input anyway, so "Climate Change" and "climate change" share a row
+    return text.lower() if "uncased" in model_name else text
+
+
+def make_key(model_name, kind, text):
+    raw = f"{model_name}\0{kind}\0{normalize_text(text, model_name)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    # Fixed-capacity float32 memmap of vectors plus a SQLite index: key -> row, with LRU eviction
+    def __init__(self, model_name, dim, directory=DEFAULT_CACHE_DIR, capacity=DEFAULT_CAPACITY):
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name).strip("_")
+        base = os.path.join(directory, f"{name}_{dim}")
+        self.model_name = model_name
+        self.dim = dim
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        vectors_path = base + ".f32"
+        # Created by appending and sizing, never with mode="w+": another process may be opening
+        # (and writing to) the same file at the same time
+        with open(vectors_path, "ab") as f:
+            if f.tell() == 0:
+                f.truncate(capacity * dim * 4)
+        # Keep the capacity the store was created with
+        self.capacity = os.path.getsize(vectors_path) // (dim * 4)
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, dim))
+
+        self._conn = sqlite3.connect(base + ".sqlite", timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER UNIQUE, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, row FROM entries WHERE key IN ({marks})", chunk
+                ).fetchall()
+                for key, row in rows:
+                    found[key] = np.array(self.vectors[row])
+                self._conn.execute(
+                    f"UPDATE entries SET accessed = ? WHERE key IN ({marks})", [now] + chunk
+                )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items):
+        # items: {key: vector}. Batch workers share the cache directory, so row allocation, the
+        # index insert and the vector write happen inside one BEGIN IMMEDIATE transaction: other
+        # processes wait on the SQLite write lock instead of picking the same free row.
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._put_rows(items, now)
+                self.vectors.flush()
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _put_rows(self, items, now):
+        used = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        for key, vector in items.items():
+            existing = self._conn.execute("SELECT row FROM entries WHERE key = ?", (key,)).fetchone()
+            if existing is not None:
+                row = existing[0]
+            elif used < self.capacity:
+                row = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM entries").fetchone()[0]
+                if row >= self.capacity:
+                    # Rows freed by an earlier clear() are reused from the bottom
+                    row = self._free_row()
+                used += 1
+            else:
+                oldest = self._conn.execute(
+                    "SELECT key, row FROM entries ORDER BY accessed ASC LIMIT 1"
+                ).fetchone()
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (oldest[0],))
+                row = oldest[1]
+                self.evictions += 1
+            self.vectors[row] = vector
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, row, accessed) VALUES (?, ?, ?)", (key, row, now)
+            )
+
+    def _free_row(self):
+        taken = {row for (row,) in self._conn.execute("SELECT row FROM entries")}
+        return next(row for row in range(self.capacity) if row not in taken)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "capacity": self.capacity,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedEmbedder:
+    # Wraps a BertEmbedder/ServiceEmbedder; only texts missing from the cache reach the model
+    def __init__(self, embedder, directory=DEFAULT_CACHE_DIR, capacity=DEFAULT_CAPACITY):
+        self.embedder = embedder
+        # Quantized / ONNX vectors differ slightly from float32 torch, so they get their own keys
+        backend = getattr(embedder, "backend", "torch")
+        self.model_name = embedder.model_name if backend == "torch" else f"{embedder.model_name}:{backend}"
+        self.directory = directory
+        self.capacity = capacity
+        # Opened now, so the very first lookup (usually the document embedding) can hit the disk;
+        # an embedder that does not know its vector size gets it on first use instead
+        dim = getattr(embedder, "hidden_size", None)
+        self.cache = EmbeddingCache(self.model_name, dim, directory, capacity) if dim else None
+
+    def _cache_for(self, dim):
+        if self.cache is None:
+            self.cache = EmbeddingCache(self.model_name, dim, self.directory, self.capacity)
+        return self.cache
+
+    def embed(self, texts):
+        texts = list(texts)
+        if not texts:
+            return self.embedder.embed(texts)
+        keys = [make_key(self.model_name, "phrase", t) for t in texts]
+        cached = self.cache.get_many(keys) if self.cache is not None else {}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            computed = self.embedder.embed(list(missing.values()))
+            new = dict(zip(missing, computed))
+            self._cache_for(computed.shape[1]).put_many(new)
+            cached.update(new)
+        return np.stack([cached[key] for key in keys]).astype(np.float32)
+
+    def embed_document(self, text):
+        key = make_key(self.model_name, "document", text)
+        if self.cache is not None:
+            cached = self.cache.get_many([key])
+            if key in cached:
+                return cached[key]
+        vector = self.embedder.embed_document(text)
+        self._cache_for(vector.shape[0]).put_many({key: vector})
+        return vector
+
+    def stats(self):
+        return self.cache.stats() if self.cache is not None else None
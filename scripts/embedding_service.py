@@ -0,0 +1,168 @@
+"""Resident BERT embedding service.
+
+Loads the model once and serves ``POST /embed`` on localhost. Requests that
+arrive within a short window are coalesced into a single forward pass, so
+many sessions embedding at the same time share the model and the batch.
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from embeddings import MODEL_NAME, get_local_embedder
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WINDOW_MS = 10
+DEFAULT_MAX_BATCH = 64
+
+
+class _PendingRequest:
+    def __init__(self, texts):
+        self.texts = texts
+        self.done = threading.Event()
+        self.embeddings = None
+        self.error = None
+
+
+class BatchingEmbedder:
+    def __init__(self, embedder, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH):
+        self.embedder = embedder
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.stats = {"requests": 0, "texts": 0, "batches": 0}
+        self._queue = []
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def embed(self, texts):
+        pending = _PendingRequest(list(texts))
+        with self._cond:
+            self._queue.append(pending)
+            self._cond.notify()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.embeddings
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            # Give concurrent callers a short window to join this batch
+            deadline = time.monotonic() + self.window
+            while sum(len(p.texts) for p in self._queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, size = [], 0
+            while self._queue and (not batch or size + len(self._queue[0].texts) <= self.max_batch):
+                pending = self._queue.pop(0)
+                batch.append(pending)
+                size += len(pending.texts)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            texts = [t for pending in batch for t in pending.texts]
+            try:
+                embeddings = self.embedder.embed(texts) if texts else []
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+                    pending.done.set()
+                continue
+
+            offset = 0
+            for pending in batch:
+                pending.embeddings = embeddings[offset:offset + len(pending.texts)]
+                offset += len(pending.texts)
+                pending.done.set()
+
+            self.stats["requests"] += len(batch)
+            self.stats["texts"] += len(texts)
+            self.stats["batches"] += 1
+
+
+def make_handler(batcher):
+    class EmbeddingHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/health":
+                self._send_json(404, {"error": "not found"})
+                return
+            self._send_json(200, {"model": batcher.embedder.model_name, "backend": batcher.embedder.backend,
+                                  "hidden_size": batcher.embedder.hidden_size, **batcher.stats})
+
+        def do_POST(self):
+            if self.path != "/embed":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length).decode("utf-8"))
+                texts = payload["texts"]
+                if payload.get("document"):
+                    # Long documents are already windowed and batched by the embedder
+                    embeddings = [batcher.embedder.embed_document(text) for text in texts]
+                else:
+                    embeddings = batcher.embed(texts)
+            except (KeyError, ValueError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {"embeddings": [list(map(float, row)) for row in embeddings]})
+
+        def log_message(self, format, *args):
+            pass
+
+    return EmbeddingHandler
+
+
+def start_background(host=DEFAULT_HOST, port=0, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH):
+    # Serve from a daemon thread of the calling process (port 0 picks a free port); returns (server, url)
+    batcher = BatchingEmbedder(get_local_embedder(MODEL_NAME), window_ms, max_batch)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH):
+    print(f"Loading {MODEL_NAME}...")
+    batcher = BatchingEmbedder(get_local_embedder(MODEL_NAME), window_ms, max_batch)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    print(f"Embedding service listening on http://{host}:{port} (window {window_ms} ms, max batch {max_batch})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 4:
+        print("Usage: python embedding_service.py [port] [window_ms] [max_batch]")
+        sys.exit(1)
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    window_ms = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WINDOW_MS
+    max_batch = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_MAX_BATCH
+    serve(port=port, window_ms=window_ms, max_batch=max_batch)
+
+# python scripts/embedding_service.py 8765
+# EMBEDDING_SERVICE_URL=http://127.0.0.1:8765 streamlit run app.py
@@ -0,0 +1,323 @@
+import os
+import json
+import threading
+import urllib.request
+import urllib.error
+
+import numpy as np
+
+MODEL_NAME = "bert-base-uncased"
+
+# Set to e.g. http://127.0.0.1:8765 to use a running embedding_service.py
+SERVICE_URL_ENV = "EMBEDDING_SERVICE_URL"
+# EMBEDDING_CACHE=0 disables the on-disk embedding cache; EMBEDDING_CACHE_DIR / _CAPACITY configure it
+CACHE_ENV = "EMBEDDING_CACHE"
+
+
+# --- Local model ---
+MAX_TOKENS = 512  # BERT's position limit, including [CLS] and [SEP]
+WINDOW_OVERLAP = 128  # tokens shared by consecutive document windows
+PHRASE_BATCH_SIZE = 32
+WINDOW_BATCH_SIZE = 8
+
+
+# "torch" (float32), "int8" (dynamically quantized torch) or "onnx" (ONNX Runtime, see export_onnx)
+BACKENDS = ("torch", "int8", "onnx")
+DEFAULT_ONNX_DIR = ".cache/onnx"
+
+
+def onnx_model_path(model_name=MODEL_NAME, directory=DEFAULT_ONNX_DIR):
+    return os.path.join(directory, model_name.strip("/").replace("/", "_"), "model.onnx")
+
+
+class BertEmbedder:
+    def __init__(self, model_name=MODEL_NAME, backend="torch", num_threads=None, onnx_path=None):
+        from transformers import AutoConfig, AutoTokenizer
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(BACKENDS)})")
+        self.model_name = model_name
+        self.backend = backend
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.hidden_size = AutoConfig.from_pretrained(model_name).hidden_size
+        self.model = None
+        self.session = None
+
+        if backend == "onnx":
+            import onnxruntime as ort
+            onnx_path = onnx_path or onnx_model_path(model_name)
+            if not os.path.exists(onnx_path):
+                raise FileNotFoundError(
+                    f"ONNX model not found: {onnx_path} (run: python scripts/embeddings.py export-onnx)"
+                )
+            options = ort.SessionOptions()
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+            self.onnx_inputs = {i.name for i in self.session.get_inputs()}
+        else:
+            import torch
+            from transformers import AutoModel
+            if num_threads:
+                torch.set_num_threads(num_threads)
+            self.model = AutoModel.from_pretrained(model_name)
+            self.model.eval()
+            if backend == "int8":
+                # int8 weights for every Linear layer; activations are quantized on the fly
+                self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear},
+                                                                    dtype=torch.qint8)
+        # The tokenizer and model are shared between threads of the service
+        self._lock = threading.Lock()
+
+    def _forward(self, inputs):
+        # inputs: numpy token id arrays, so the onnx backend runs without torch installed
+        if self.session is not None:
+            feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.onnx_inputs}
+            if "token_type_ids" in self.onnx_inputs and "token_type_ids" not in feed:
+                feed["token_type_ids"] = np.zeros_like(feed["input_ids"])
+            with self._lock:
+                last_hidden_state = self.session.run(None, feed)[0]
+            return last_hidden_state[:, 0, :].astype(np.float32)
+
+        import torch
+        inputs = {name: torch.from_numpy(value) for name, value in inputs.items()}
+        with self._lock:
+            with torch.no_grad():
+                outputs = self.model(**inputs)
+        return outputs.last_hidden_state[:, 0, :].numpy()
+
+    def embed(self, texts, batch_size=PHRASE_BATCH_SIZE):
+        # Length-sorted micro-batches keep padding (and memory) small; rows come back in input order
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.hidden_size), dtype=np.float32)
+        lengths = [len(ids) for ids in self.tokenizer(texts, truncation=True, max_length=MAX_TOKENS)["input_ids"]]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+
+        embeddings = np.empty((len(texts), self.hidden_size), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            inputs = self.tokenizer([texts[i] for i in idx], padding=True, truncation=True,
+                                    max_length=MAX_TOKENS, return_tensors='np')
+            embeddings[idx] = self._forward(inputs)
+        return embeddings
+
+    def document_windows(self, text, overlap=WINDOW_OVERLAP):
+        # Token ids of overlapping windows covering the whole text (not just the first 512 tokens)
+        ids = self.tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"]
+        body = MAX_TOKENS - 2
+        step = body - overlap
+        windows = [ids[:body]]
+        start = step
+        while start + overlap < len(ids):
+            windows.append(ids[start:start + body])
+            start += step
+        return windows
+
+    def embed_document(self, text, overlap=WINDOW_OVERLAP, batch_size=WINDOW_BATCH_SIZE):
+        # Embed each window in fixed-size batches and pool them, weighted by window length.
+        # A text that fits in one window gives the same vector as embed([text])[0].
+        windows = self.document_windows(text, overlap)
+        cls_id, sep_id, pad_id = self.tokenizer.cls_token_id, self.tokenizer.sep_token_id, self.tokenizer.pad_token_id
+
+        pooled = np.zeros(self.hidden_size, dtype=np.float64)
+        total = 0
+        for start in range(0, len(windows), batch_size):
+            batch = [[cls_id] + w + [sep_id] for w in windows[start:start + batch_size]]
+            width = max(len(w) for w in batch)
+            input_ids = np.array([w + [pad_id] * (width - len(w)) for w in batch], dtype=np.int64)
+            attention_mask = np.array([[1] * len(w) + [0] * (width - len(w)) for w in batch], dtype=np.int64)
+            embeddings = self._forward({"input_ids": input_ids, "attention_mask": attention_mask})
+            for row, w in zip(embeddings, batch):
+                pooled += row * len(w)
+                total += len(w)
+        return (pooled / max(total, 1)).astype(np.float32)
+
+
+# --- Remote model (embedding_service.py) ---
+class ServiceEmbedder:
+    def __init__(self, url, model_name=MODEL_NAME, timeout=60):
+        self.url = url.rstrip("/")
+        self.model_name = model_name
+        self.backend = "torch"  # updated from /health
+        self.hidden_size = None  # updated from /health
+        self.timeout = timeout
+
+    def _post_embed(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        request = urllib.request.Request(
+            f"{self.url}/embed", data=body, headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = json.loads(response.read().decode("utf-8"))
+        return np.asarray(data["embeddings"], dtype=np.float32)
+
+    def embed(self, texts):
+        return self._post_embed({"texts": list(texts)})
+
+    def embed_document(self, text):
+        return self._post_embed({"texts": [text], "document": True})[0]
+
+    def is_alive(self):
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=2) as response:
+                health = json.loads(response.read().decode("utf-8"))
+                self.backend = health.get("backend", "torch")
+                self.hidden_size = health.get("hidden_size")
+                return response.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+
+
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+
+def get_local_embedder(model_name=MODEL_NAME, backend=None, num_threads=None):
+    # Load the weights once per process and reuse them for every article.
+    # EMBEDDING_BACKEND (torch|int8|onnx) and EMBEDDING_THREADS pick the CPU inference setup.
+    backend = backend or os.environ.get("EMBEDDING_BACKEND", "torch")
+    num_threads = num_threads or int(os.environ.get("EMBEDDING_THREADS", 0)) or None
+    with _embedders_lock:
+        key = (model_name, backend)
+        if key not in _embedders:
+            _embedders[key] = BertEmbedder(model_name, backend, num_threads)
+        return _embedders[key]
+
+
+_cached_embedders = {}
+
+
+def _with_cache(embedder, kind):
+    if os.environ.get(CACHE_ENV, "1") == "0":
+        return embedder
+    from embedding_cache import CachedEmbedder, DEFAULT_CACHE_DIR, DEFAULT_CAPACITY
+    with _embedders_lock:
+        key = (embedder.model_name, embedder.backend, kind)
+        if key not in _cached_embedders:
+            _cached_embedders[key] = CachedEmbedder(
+                embedder,
+                os.environ.get("EMBEDDING_CACHE_DIR", DEFAULT_CACHE_DIR),
+                int(os.environ.get("EMBEDDING_CACHE_CAPACITY", DEFAULT_CAPACITY)),
+            )
+        cached = _cached_embedders[key]
+        cached.embedder = embedder
+        return cached
+
+
+def get_embedder(model_name=MODEL_NAME):
+    url = os.environ.get(SERVICE_URL_ENV)
+    if url:
+        remote = ServiceEmbedder(url, model_name)
+        if remote.is_alive():
+            return _with_cache(remote, "service")
+        print(f"Embedding service at {url} is not reachable, loading {model_name} locally.")
+    return _with_cache(get_local_embedder(model_name), "local")
+
+
+# --- ONNX export and parity ---
+def export_onnx(model_name=MODEL_NAME, output_path=None, opset=17):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    output_path = output_path or onnx_model_path(model_name)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    class EncoderOutput(torch.nn.Module):
+        # Fixed positional signature for tracing; returns only last_hidden_state
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic = {0: "batch", 1: "sequence"}
+    torch.onnx.export(
+        EncoderOutput(model),
+        tuple(sample[name] for name in names),
+        output_path,
+        input_names=names,
+        output_names=["last_hidden_state"],
+        dynamic_axes={name: dynamic for name in names + ["last_hidden_state"]},
+        opset_version=opset,
+        dynamo=False,
+    )
+    print(f"ONNX model saved to {output_path}")
+    return output_path
+
+
+def rank_candidates(embedder, text, candidate_phrases):
+    # Cosine similarity of each candidate to the document, highest first
+    doc = embedder.embed_document(text)
+    candidates = embedder.embed(candidate_phrases)
+    sims = candidates @ doc / (np.linalg.norm(candidates, axis=1) * np.linalg.norm(doc) + 1e-12)
+    return np.argsort(-sims), sims
+
+
+def check_parity(text, candidate_phrases, backend, model_name=MODEL_NAME, max_keywords=10, num_threads=None):
+    # Compare a backend's keyword ranking and scores with the float32 torch reference
+    import time
+    reference = BertEmbedder(model_name, "torch", num_threads)
+    candidate = BertEmbedder(model_name, backend, num_threads)
+
+    timings = {}
+    results = {}
+    for name, embedder in (("torch", reference), (backend, candidate)):
+        start = time.perf_counter()
+        results[name] = rank_candidates(embedder, text, candidate_phrases)
+        timings[name] = time.perf_counter() - start
+
+    ref_order, ref_sims = results["torch"]
+    new_order, new_sims = results[backend]
+    n = len(candidate_phrases)
+    k = min(max_keywords, n)
+    overlap = len(set(ref_order[:k]) & set(new_order[:k])) / k if k else 1.0
+    # Spearman rank correlation between the two full rankings
+    ref_rank = np.argsort(ref_order)
+    new_rank = np.argsort(new_order)
+    spearman = 1 - 6 * np.sum((ref_rank - new_rank) ** 2) / (n * (n * n - 1)) if n > 1 else 1.0
+    return {
+        "backend": backend,
+        "top_k_overlap": overlap,
+        "same_top_k_order": bool(np.array_equal(ref_order[:k], new_order[:k])),
+        "spearman": float(spearman),
+        "max_score_diff": float(np.max(np.abs(ref_sims - new_sims))) if n else 0.0,
+        "seconds": timings,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Embedding backend utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export-onnx", help="export the model for the onnx backend")
+    export.add_argument("--model", default=MODEL_NAME)
+    export.add_argument("--output", default=None)
+    parity = sub.add_parser("parity", help="compare a backend's keyword ranking with float32 torch")
+    parity.add_argument("article")
+    parity.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="int8")
+    parity.add_argument("--model", default=MODEL_NAME)
+    parity.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "export-onnx":
+        export_onnx(args.model, args.output)
+        sys.exit(0)
+
+    from extract_keywords import extract_rake, extract_yake
+    with open(args.article, "r", encoding="utf-8") as f:
+        text = f.read()
+    report = check_parity(text, extract_rake(text) + extract_yake(text), args.backend, args.model,
+                          num_threads=args.threads)
+    print(json.dumps(report, indent=2))
+
+# python scripts/embeddings.py export-onnx
+# python scripts/embeddings.py parity articles/article_1.txt --backend onnx --threads 4
@@ -1,77 +1,355 @@
-import json
-from rake_nltk import Rake
-import yake
-from transformers import AutoTokenizer, AutoModel, AutoModelForTokenClassification
-import torch
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-
-import nltk
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+import re
+from collections import Counter
+
+# Heavy dependencies (rake_nltk, yake, numpy, transformers/torch) are imported
+# inside the method that needs them, so RAKE/YAKE-only runs never load the BERT stack.
 
 def extract_rake(text, max_keywords=10):
+    from rake_nltk import Rake
+    from nltk_resources import ensure_resource
+    ensure_resource('corpora/stopwords', 'stopwords')
+
     r = Rake()
     r.extract_keywords_from_text(text)
     ranked_phrases = r.get_ranked_phrases()[:max_keywords]
     return ranked_phrases
 
 def extract_yake(text, max_keywords=10):
+    import yake
     kw_extractor = yake.KeywordExtractor(lan="en", n=1, top=max_keywords)
     keywords = kw_extractor.extract_keywords(text)
     return [kw for kw, score in keywords]
 
+# --- Candidate generation for BERTScore ---
+CANDIDATE_NGRAM_RANGE = (1, 3)
+MAX_CANDIDATES = 5000
+SCORE_BATCH_SIZE = 1024  # candidates embedded and scored per chunk
+MMR_POOL_FACTOR = 10  # MMR only re-ranks the top max_keywords * factor candidates
+# BERTScore candidates: RAKE+YAKE phrases, n-grams of the text, or only its adjective/noun phrases
+CANDIDATE_MODES = ("rake_yake", "ngrams", "noun_phrases")
+NGRAM_MODES = ("ngrams", "noun_phrases")
+
+_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z0-9'-]*|[^\sA-Za-z]")
+
+
+def candidate_counts(text, ngram_range=CANDIDATE_NGRAM_RANGE, noun_phrases=False):
+    # n-grams of content words that never cross a stopword or punctuation, with their counts.
+    # With noun_phrases=True only adjective/noun runs ending in a noun are kept (needs the NLTK tagger).
+    from nltk_resources import english_stopwords
+    stop_words = english_stopwords()
+    tokens = _TOKEN_RE.findall(text)
+
+    tags = None
+    if noun_phrases:
+        import nltk
+        from nltk_resources import ensure_resource
+        ensure_resource('taggers/averaged_perceptron_tagger_eng', 'averaged_perceptron_tagger_eng')
+        tags = [tag for _, tag in nltk.pos_tag(tokens)]
+
+    runs, run = [], []
+    for i, token in enumerate(tokens):
+        word = token.lower()
+        if not word[0].isalpha() or word in stop_words or len(word) < 2:
+            if run:
+                runs.append(run)
+            run = []
+            continue
+        run.append((word, tags[i] if tags else None))
+    if run:
+        runs.append(run)
+
+    counts = Counter()
+    low, high = ngram_range
+    for run in runs:
+        for n in range(low, high + 1):
+            for start in range(len(run) - n + 1):
+                gram = run[start:start + n]
+                if tags is not None and not (
+                    gram[-1][1].startswith("NN") and all(t.startswith(("NN", "JJ")) for _, t in gram)
+                ):
+                    continue
+                counts[" ".join(word for word, _ in gram)] += 1
+    return counts
+
+
+def generate_candidates(text, ngram_range=CANDIDATE_NGRAM_RANGE, max_candidates=MAX_CANDIDATES, noun_phrases=False):
+    # Most frequent first
+    counts = candidate_counts(text, ngram_range, noun_phrases)
+    return [phrase for phrase, _ in counts.most_common(max_candidates)]
+
+
+def _normalize_rows(matrix):
+    import numpy as np
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def top_k_indices(scores, k):
+    # Partial selection (O(n)) of the k best, then a sort of just those k
+    import numpy as np
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=int)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def mmr_select(doc_sims, candidate_embeddings, k, diversity=0.5):
+    # Maximal Marginal Relevance: trade similarity to the document against similarity to
+    # already selected phrases. Each step is one matrix-vector product over all candidates.
+    import numpy as np
+    normed = _normalize_rows(candidate_embeddings)
+    k = min(k, len(doc_sims))
+    if k <= 0:
+        return []
+    selected = [int(np.argmax(doc_sims))]
+    max_sim_to_selected = normed @ normed[selected[0]]
+    available = np.ones(len(doc_sims), dtype=bool)
+    available[selected[0]] = False
+    for _ in range(k - 1):
+        mmr = (1 - diversity) * doc_sims - diversity * max_sim_to_selected
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        max_sim_to_selected = np.maximum(max_sim_to_selected, normed @ normed[best])
+    return selected
+
+
 # Basic BERTScore-based keyword extraction:
-# Here we score candidate keywords by their embedding similarity to the document embedding
-def extract_bert_keywords(text, candidate_phrases, max_keywords=10):
-    from transformers import AutoTokenizer, AutoModel
-    tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-    model = AutoModel.from_pretrained('bert-base-uncased')
-    
-    def embed_text(texts):
-        inputs = tokenizer(texts, padding=True, truncation=True, return_tensors='pt')
-        with torch.no_grad():
-            outputs = model(**inputs)
-        embeddings = outputs.last_hidden_state[:,0,:].numpy()
-        return embeddings
-
-    doc_embedding = embed_text([text])[0]
-    candidates_embeddings = embed_text(candidate_phrases)
-    sims = cosine_similarity([doc_embedding], candidates_embeddings)[0]
-    
-    top_idx = np.argsort(sims)[::-1][:max_keywords]
+# Here we score candidate keywords by their embedding similarity to the document embedding.
+# Without candidate_phrases, n-gram candidates are generated from the text; diversity (0-1)
+# switches the final selection to MMR.
+def extract_bert_keywords(text, candidate_phrases=None, max_keywords=10, diversity=None, doc_embedding=None):
+    import numpy as np
+    from embeddings import get_embedder
+    # Resident model (or embedding_service.py) instead of reloading the weights per call
+    embedder = get_embedder()
+
+    if candidate_phrases is None:
+        candidate_phrases = generate_candidates(text)
+    if not candidate_phrases:
+        return []
+
+    # The whole article is covered by overlapping 512-token windows, not just its start
+    if doc_embedding is None:
+        doc_embedding = embedder.embed_document(text)
+    doc_embedding = _normalize_rows(doc_embedding)
+
+    # Candidates are embedded and scored chunk by chunk; only the similarity vector is kept, plus
+    # for MMR the embeddings of the best max_keywords * MMR_POOL_FACTOR candidates so far
+    sims = np.empty(len(candidate_phrases), dtype=np.float32)
+    pool_size = max_keywords * MMR_POOL_FACTOR
+    pool, pool_embeddings = np.empty(0, dtype=int), None
+    for start in range(0, len(candidate_phrases), SCORE_BATCH_SIZE):
+        chunk = embedder.embed(candidate_phrases[start:start + SCORE_BATCH_SIZE])
+        sims[start:start + len(chunk)] = _normalize_rows(chunk) @ doc_embedding
+        if diversity is not None:
+            indices = np.concatenate([pool, np.arange(start, start + len(chunk))])
+            vectors = chunk if pool_embeddings is None else np.concatenate([pool_embeddings, chunk])
+            keep = top_k_indices(sims[indices], pool_size)
+            pool, pool_embeddings = indices[keep], vectors[keep]
+
+    if diversity is None:
+        top_idx = top_k_indices(sims, max_keywords)
+    else:
+        top_idx = [pool[i] for i in mmr_select(sims[pool], pool_embeddings, max_keywords, diversity)]
+
     top_keywords = [candidate_phrases[i] for i in top_idx]
     return top_keywords
 
-if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 3:
-        print("Usage: python extract_keywords.py <input_text_file> <output_json_file>")
-        sys.exit(1)
-    
-    input_path = sys.argv[1]
-    output_path = sys.argv[2]
-    
-    with open(input_path, "r", encoding="utf-8") as f:
-        text = f.read()
-
+def extract_all(text, candidates="rake_yake", diversity=None):
     print("Extracting RAKE keywords...")
     rake_keywords = extract_rake(text)
     print("Extracting YAKE keywords...")
     yake_keywords = extract_yake(text)
     print("Generating candidate phrases for BERTScore...")
-    # As a simple candidate phrase set for BERTScore, used both rake and yake keywords here
-    bert_keywords = extract_bert_keywords(text, rake_keywords + yake_keywords)
-    
-    results = {
+    if candidates in NGRAM_MODES:
+        # Thousands of n-gram candidates for higher recall, or only the noun phrases among them
+        candidate_phrases = generate_candidates(text, noun_phrases=candidates == "noun_phrases")
+    else:
+        # As a simple candidate phrase set for BERTScore, used both rake and yake keywords here
+        candidate_phrases = rake_keywords + yake_keywords
+    bert_keywords = extract_bert_keywords(text, candidate_phrases, diversity=diversity)
+
+    return {
         "rake": rake_keywords,
         "yake": yake_keywords,
         "bert_score": bert_keywords
     }
+
+# --- Streaming extraction for very large texts ---
+# The file is read paragraph by paragraph and processed in chunks of about STREAM_CHUNK_CHARS,
+# optionally in worker processes. Only the running phrase statistics stay in memory.
+STREAM_CHUNK_CHARS = 200_000
+YAKE_CHUNK_OVERSAMPLE = 5  # keywords kept per chunk, as a multiple of max_keywords
+
+
+def iter_paragraph_chunks(lines, chunk_chars=STREAM_CHUNK_CHARS):
+    # Chunks end on a blank line; a single paragraph longer than 4x chunk_chars is cut at a line end
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if (size >= chunk_chars and not line.strip()) or size >= 4 * chunk_chars:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    chunk = "".join(buffer)
+    if chunk.strip():
+        yield chunk
+
+
+def rake_phrase_counts(text):
+    from rake_nltk import Rake
+    from nltk_resources import ensure_resource
+    ensure_resource('corpora/stopwords', 'stopwords')
+
+    r = Rake()
+    r.extract_keywords_from_text(text)
+    # wordpunct tokens never contain spaces, so splitting the joined phrase gives the words back
+    return Counter(tuple(phrase.split(" ")) for _, phrase in r.get_ranked_phrases_with_scores())
+
+
+def rank_rake_phrases(phrase_counts, max_keywords=10):
+    # Same degree/frequency scoring as Rake, computed from phrase counts merged over all chunks
+    frequency, degree = Counter(), Counter()
+    for phrase, count in phrase_counts.items():
+        for word in phrase:
+            frequency[word] += count
+            degree[word] += count * len(phrase)
+
+    ranked = sorted(
+        ((sum(1.0 * degree[w] / frequency[w] for w in phrase), " ".join(phrase), count)
+         for phrase, count in phrase_counts.items()),
+        reverse=True,
+    )
+    phrases = []
+    for _, phrase, count in ranked:
+        # Rake lists a repeated phrase once per occurrence
+        phrases.extend([phrase] * count)
+        if len(phrases) >= max_keywords:
+            break
+    return phrases[:max_keywords]
+
+
+def merge_yake_scores(chunk_scores, max_keywords=10):
+    # YAKE's features (position, spread over sentences, context) are document-global, so chunks
+    # cannot be merged exactly. Each chunk votes 1/score (lower YAKE scores are better), weighted
+    # by its share of the text; keywords strong in many chunks rank first.
+    total = sum(length for length, _ in chunk_scores) or 1
+    merged, surface = Counter(), {}
+    for length, scored in chunk_scores:
+        for kw, score in scored:
+            key = kw.lower()
+            surface.setdefault(key, kw)
+            merged[key] += (length / total) / max(score, 1e-12)
+    return [surface[key] for key, _ in merged.most_common(max_keywords)]
+
+
+def chunk_statistics(chunk, max_keywords=10, ngram_candidates=False, noun_phrases=False):
+    # Runs in a worker process: everything needed from one chunk, as mergeable statistics
+    import yake
+    kw_extractor = yake.KeywordExtractor(lan="en", n=1, top=max_keywords * YAKE_CHUNK_OVERSAMPLE)
+    return {
+        "length": len(chunk),
+        "rake": rake_phrase_counts(chunk),
+        "yake": kw_extractor.extract_keywords(chunk),
+        "candidates": candidate_counts(chunk, noun_phrases=noun_phrases) if ngram_candidates else None,
+    }
+
+
+def extract_all_stream(path, candidates="rake_yake", diversity=None, workers=None,
+                       chunk_chars=STREAM_CHUNK_CHARS, max_keywords=10):
+    import functools
+    from concurrent.futures import ProcessPoolExecutor
+    import numpy as np
+    from embeddings import get_embedder
+
+    task = functools.partial(chunk_statistics, max_keywords=max_keywords,
+                             ngram_candidates=candidates in NGRAM_MODES, noun_phrases=candidates == "noun_phrases")
+    executor = ProcessPoolExecutor(workers) if workers and workers > 1 else None
+    embedder = get_embedder()
+
+    rake_counts, candidate_totals, yake_scores = Counter(), Counter(), []
+    doc_sum, doc_weight = None, 0
+
+    def merge(stats):
+        rake_counts.update(stats["rake"])
+        yake_scores.append((stats["length"], stats["yake"]))
+        if stats["candidates"] is not None:
+            candidate_totals.update(stats["candidates"])
+
+    print("Extracting RAKE/YAKE statistics and document embedding chunk by chunk...")
+    pending = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for chunk in iter_paragraph_chunks(f, chunk_chars):
+                if executor is None:
+                    merge(task(chunk))
+                else:
+                    pending.append(executor.submit(task, chunk))
+                    # Bounded number of chunks in flight, merged in file order
+                    while len(pending) > 2 * workers:
+                        merge(pending.pop(0).result())
+                # The document embedding is computed here while the workers run RAKE/YAKE
+                vector = embedder.embed_document(chunk).astype(np.float64)
+                doc_sum = vector * len(chunk) if doc_sum is None else doc_sum + vector * len(chunk)
+                doc_weight += len(chunk)
+        for future in pending:
+            merge(future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    rake_keywords = rank_rake_phrases(rake_counts, max_keywords)
+    yake_keywords = merge_yake_scores(yake_scores, max_keywords)
+    if doc_sum is None:
+        return {"rake": [], "yake": [], "bert_score": []}
+
+    print("Generating candidate phrases for BERTScore...")
+    if candidates in NGRAM_MODES:
+        candidate_phrases = [phrase for phrase, _ in candidate_totals.most_common(MAX_CANDIDATES)]
+    else:
+        candidate_phrases = rake_keywords + yake_keywords
+    doc_embedding = (doc_sum / doc_weight).astype(np.float32)
+    bert_keywords = extract_bert_keywords(None, candidate_phrases, max_keywords, diversity, doc_embedding)
+
+    return {
+        "rake": rake_keywords,
+        "yake": yake_keywords,
+        "bert_score": bert_keywords
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from reference_io import save_json
+
+    parser = argparse.ArgumentParser(description="Extract RAKE, YAKE and BERTScore keywords from an article.")
+    parser.add_argument("input_text_file")
+    parser.add_argument("output_json_file")
+    parser.add_argument("--candidates", choices=CANDIDATE_MODES, default="rake_yake",
+                        help="BERTScore candidates: RAKE+YAKE phrases, n-grams generated from the text, or only "
+                             "the adjective/noun phrases among them (uses the NLTK tagger)")
+    parser.add_argument("--diversity", type=float, default=None,
+                        help="select BERTScore keywords with MMR at this diversity (0-1)")
+    parser.add_argument("--stream", action="store_true",
+                        help="process the file in paragraph chunks with bounded memory")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for --stream (default: run in this process)")
+    parser.add_argument("--chunk-chars", type=int, default=STREAM_CHUNK_CHARS)
+    args = parser.parse_args()
     
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2)
+    input_path = args.input_text_file
+    output_path = args.output_json_file
+    
+    if args.stream:
+        keywords = extract_all_stream(input_path, args.candidates, args.diversity, args.workers, args.chunk_chars)
+    else:
+        with open(input_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        keywords = extract_all(text, args.candidates, args.diversity)
+
+    save_json(output_path, keywords)
     
     print(f"Keywords saved to {output_path}")
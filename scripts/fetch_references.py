@@ -1,16 +1,20 @@
-import requests
 import json
-import nltk
+import math
 import re
 import string
-from nltk.corpus import stopwords
-from typing import List, Dict
-
-nltk.download('stopwords')
+from typing import List, Dict, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from response_cache import get_cache
+from http_client import get_client
+from reference import Reference
+from reference_io import META_KEY, FetchJournal, to_json
+from nltk_resources import english_stopwords
 
 # --- Utility ---
 def clean_and_filter_keywords(keywords):
-    stop_words = set(stopwords.words("english"))
+    # Local NLTK corpus if installed, bundled list otherwise; no download at import or call time
+    stop_words = english_stopwords()
     cleaned_keywords = []
 
     for kw in keywords:
@@ -29,142 +33,582 @@ def clean_and_filter_keywords(keywords):
     return unique_keywords[:5]
 
 
+# --- HTTP ---
+# Returns (status_code, payload); payload is the parsed JSON on success, the response text otherwise
+def get_json(source, url, params, query):
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get(source, query, params)
+        if cached is not None:
+            return 200, cached
+
+    # Pooled session with per-source rate limiting, timeouts and retries
+    response = get_client().get(source, url, params=params)
+    if response.status_code != 200:
+        return response.status_code, response.text
+
+    data = response.json()
+    if cache is not None:
+        cache.set(source, query, params, data)
+    return 200, data
+
+
+# Same as get_json for POST endpoints; the body is part of the cache key
+def post_json(source, url, params, body, query):
+    cache_params = {**params, "body": body}
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get(source, query, cache_params)
+        if cached is not None:
+            return 200, cached
+
+    response = get_client().post(source, url, params=params, json=body)
+    if response.status_code != 200:
+        return response.status_code, response.text
+
+    data = response.json()
+    if cache is not None:
+        cache.set(source, query, cache_params, data)
+    return 200, data
+
+
+# --- Paging ---
+# Largest page each API accepts; deep result sets are streamed page by page
+OPENALEX_PAGE_SIZE = 200
+CROSSREF_PAGE_SIZE = 1000
+SEMANTICSCHOLAR_PAGE_SIZE = 100
+
+
+def _collect_pages(pages):
+    # None if the first request failed, otherwise every ref from the pages that succeeded
+    refs = None
+    for page in pages:
+        if refs is None:
+            refs = []
+        refs.extend(page)
+    return refs
+
+
 # --- OpenAlex ---
-def query_openalex(keywords, max_results=2):
+# Only request the fields mapped below
+OPENALEX_SELECT = "id,doi,title,publication_year,authorships,primary_location"
+# Batched queries search titles and abstracts, so their hits are assigned to keywords on both
+OPENALEX_BATCH_SELECT = OPENALEX_SELECT + ",abstract_inverted_index"
+
+
+def openalex_abstract(inverted_index):
+    # OpenAlex ships abstracts as {word: [positions]}
+    if not inverted_index:
+        return None
+    positions = sorted((pos, word) for word, places in inverted_index.items() for pos in places)
+    return " ".join(word for _, word in positions)
+
+
+def openalex_ref(item):
+    source = (item.get("primary_location") or {}).get("source") or {}
+    return Reference(
+        title=item.get("title"),
+        authors=[(auth.get("author") or {}).get("display_name", "") for auth in item.get("authorships") or []],
+        year=item.get("publication_year"),
+        journal=source.get("display_name"),
+        doi=item.get("doi"),
+        url=item.get("id"),
+        abstract=openalex_abstract(item.get("abstract_inverted_index")),
+        source="openalex",
+    )
+
+
+def iter_openalex_pages(kw, max_results=2, page_size=OPENALEX_PAGE_SIZE, search_filter=None, select=OPENALEX_SELECT):
     base_url = "https://api.openalex.org/works"
-    keyword_to_refs = {}
-
+    cursor = "*"
+    remaining = max_results
+    while remaining > 0 and cursor:
+        params = {"per_page": min(page_size, remaining), "cursor": cursor, "select": select}
+        if search_filter:
+            params["filter"] = search_filter
+        else:
+            params["search"] = kw
+        status, data = get_json("openalex", base_url, params, kw)
+        if status != 200:
+            print(f"OpenAlex query failed for '{kw}' with status {status}")
+            return
+
+        page = [openalex_ref(item) for item in data.get('results', [])][:remaining]
+        yield page
+        if not page:
+            return
+        remaining -= len(page)
+        cursor = data.get("meta", {}).get("next_cursor")
+
+
+def search_openalex(kw, max_results=2):
+    return _collect_pages(iter_openalex_pages(kw, max_results))
+
+
+def query_openalex(keywords, max_results=2, batch_size=1):
     print(f"Querying OpenAlex with up to {max_results} results per keyword...")
-    for kw in keywords:
-        params = {"search": kw, "per_page": max_results}
-        response = requests.get(base_url, params=params)
-        if response.status_code != 200:
-            print(f"OpenAlex query failed for '{kw}' with status {response.status_code}")
+    if batch_size > 1:
+        keyword_to_refs = {}
+        for i in range(0, len(keywords), batch_size):
+            keyword_to_refs.update(search_openalex_batch(keywords[i:i + batch_size], max_results))
+        return keyword_to_refs
+    return _query_each(search_openalex, keywords, max_results)
+
+
+# --- OpenAlex batching ---
+# Number of keywords OR-combined into a single OpenAlex request
+OPENALEX_BATCH_SIZE = 5
+# Results requested per keyword in a batch, to leave room for uneven matches
+BATCH_OVERSAMPLE = 2
+
+
+def _tokens(text):
+    return set(re.findall(r"[a-z0-9]+", (text or "").lower()))
+
+
+def demux_by_keyword(refs, keywords, max_results, buckets=None):
+    # Assign each result to every keyword fully contained in its title and abstract (the fields the
+    # batch filter searched), else to the best partial match. Adds to buckets when given.
+    keyword_tokens = {kw: _tokens(kw) for kw in keywords}
+    buckets = {kw: [] for kw in keywords} if buckets is None else buckets
+    for ref in refs:
+        text = _tokens(ref.title) | _tokens(ref.abstract)
+        scores = {kw: len(tokens & text) / len(tokens) for kw, tokens in keyword_tokens.items() if tokens}
+        if not scores:
             continue
+        matched = [kw for kw, score in scores.items() if score == 1.0]
+        if not matched:
+            best = max(scores, key=scores.get)
+            matched = [best] if scores[best] > 0 else []
+        for kw in matched:
+            if len(buckets[kw]) < max_results:
+                buckets[kw].append(ref)
+    return buckets
+
+
+def search_openalex_batch(keywords, max_results=2):
+    # "," separates filters and "|" separates OR values, so neither may appear inside a keyword
+    terms = [re.sub(r"[,|]", " ", kw).strip() for kw in keywords]
+    search_filter = "title_and_abstract.search:" + "|".join(terms)
+    total = max_results * len(keywords) * BATCH_OVERSAMPLE
+
+    # Pages are assigned as they arrive. Another page is requested only while the pages so far
+    # are on course to fill every keyword within the round-trips a search per keyword would take,
+    # or while one more page still saves requests even if it fills nothing; keywords left short
+    # fall back to their own search.
+    per_keyword = math.ceil(max_results / OPENALEX_PAGE_SIZE)  # pages of one keyword's own search
+    unbatched = per_keyword * len(keywords)
+    wanted = max_results * len(keywords)
+    buckets = {kw: [] for kw in keywords}
+    seen = 0
+    exhausted = False
+    pages = iter_openalex_pages(" | ".join(keywords), total, search_filter=search_filter,
+                                select=OPENALEX_BATCH_SELECT)
+    for requests, page in enumerate(pages, 1):
+        exhausted = len(page) < min(OPENALEX_PAGE_SIZE, total - seen)  # a short page is the last one
+        seen += len(page)
+        demux_by_keyword(page, keywords, max_results, buckets)
+        filled = sum(min(len(refs), max_results) for refs in buckets.values())
+        if filled == wanted or exhausted:
+            break
+        short = sum(len(refs) < max_results for refs in buckets.values())
+        on_course = filled and requests + math.ceil((wanted - filled) * requests / filled) <= unbatched
+        if not on_course and requests + 1 + short * per_keyword > unbatched:
+            break
+
+    # Keywords the combined query could not fill fall back to their own request, unless it ran out
+    # of hits: then every title/abstract match of every keyword has been assigned already
+    for kw in keywords:
+        if len(buckets[kw]) < max_results and not exhausted:
+            own = search_openalex(kw, max_results)
+            if own is not None:
+                buckets[kw] = own
+    return buckets
 
-        data = response.json()
-        refs = []
-        for item in data.get('results', []):
-            refs.append({
-                "title": item.get("title"),
-                "author": ", ".join([auth.get("author", {}).get("display_name", "") for auth in item.get("authorships", [])]),
-                "year": item.get("publication_year"),
-                "journal": item.get("host_venue", {}).get("display_name"),
-                "doi": item.get("doi"),
-                "url": item.get("id")
-            })
-        keyword_to_refs[kw] = refs[:max_results]
 
-    return keyword_to_refs
+# --- Crossref ---
+CROSSREF_SELECT = "title,author,issued,container-title,DOI,URL"
 
 
-# --- Crossref ---
-def query_crossref(keywords, max_results=2):
+def crossref_ref(item):
+    return Reference(
+        title=item.get("title", [""])[0] if item.get("title") else "",
+        authors=item.get("author"),
+        year=item.get("issued", {}).get("date-parts", [[None]])[0][0],
+        journal=item.get("container-title", [""])[0] if item.get("container-title") else "",
+        doi=item.get("DOI"),
+        url=item.get("URL"),
+        source="crossref",
+    )
+
+
+def iter_crossref_pages(kw, max_results=2, page_size=CROSSREF_PAGE_SIZE):
     base_url = "https://api.crossref.org/works"
-    keyword_to_refs = {}
+    cursor = "*"
+    remaining = max_results
+    while remaining > 0 and cursor:
+        params = {"query": kw, "rows": min(page_size, remaining), "cursor": cursor, "select": CROSSREF_SELECT}
+        status, data = get_json("crossref", base_url, params, kw)
+        if status != 200:
+            print(f"Crossref query failed for '{kw}' with status {status}")
+            return
 
-    print(f"Querying Crossref with up to {max_results} results per keyword...")
-    for kw in keywords:
-        params = {"query": kw, "rows": max_results}
-        response = requests.get(base_url, params=params)
-        if response.status_code != 200:
-            print(f"Crossref query failed for '{kw}' with status {response.status_code}")
-            continue
+        message = data.get('message', {})
+        page = [crossref_ref(item) for item in message.get('items', [])][:remaining]
+        yield page
+        if not page:
+            return
+        remaining -= len(page)
+        cursor = message.get("next-cursor")
 
-        data = response.json()
-        refs = []
-        for item in data.get('message', {}).get('items', []):
-            refs.append({
-                "title": item.get("title", [""])[0] if item.get("title") else "",
-                "author": ", ".join([f"{a.get('given', '')} {a.get('family', '')}".strip() for a in item.get("author", [])]) if item.get("author") else "",
-                "year": item.get("issued", {}).get("date-parts", [[None]])[0][0],
-                "journal": item.get("container-title", [""])[0] if item.get("container-title") else "",
-                "doi": item.get("DOI"),
-                "url": item.get("URL")
-            })
-        keyword_to_refs[kw] = refs[:max_results]
 
-    return keyword_to_refs
+def search_crossref(kw, max_results=2):
+    return _collect_pages(iter_crossref_pages(kw, max_results))
+
+
+def query_crossref(keywords, max_results=2):
+    print(f"Querying Crossref with up to {max_results} results per keyword...")
+    return _query_each(search_crossref, keywords, max_results)
 
 
 # --- Semantic Scholar ---
+SEMANTICSCHOLAR_FIELDS = "title,authors,year,abstract,url,venue,externalIds"
+
+
+def semanticscholar_ref(item):
+    return Reference(
+        title=item.get("title"),
+        authors=item.get("authors"),
+        year=item.get("year"),
+        journal=item.get("venue"),
+        doi=(item.get("externalIds") or {}).get("DOI"),
+        abstract=item.get("abstract"),
+        url=item.get("url"),
+        source="semanticscholar",
+    )
+
+
+def iter_semanticscholar_pages(kw: str, max_results: int = 2, page_size: int = SEMANTICSCHOLAR_PAGE_SIZE):
+    url = "https://api.semanticscholar.org/graph/v1/paper/search"
+    offset = 0
+    remaining = max_results
+    while remaining > 0 and offset is not None:
+        params = {"query": kw, "offset": offset, "limit": min(page_size, remaining), "fields": SEMANTICSCHOLAR_FIELDS}
+        status, data = get_json("semanticscholar", url, params, kw)
+        if status != 200:
+            print(f"❌ Semantic Scholar query failed for '{kw}' with status {status}")
+            print("Response content:", data)
+            return
+
+        page = [semanticscholar_ref(item) for item in data.get("data", [])][:remaining]
+        yield page
+        if not page:
+            return
+        remaining -= len(page)
+        offset = data.get("next")
+
+
+def search_semanticscholar(kw: str, max_results: int = 2) -> Optional[List[Dict]]:
+    print(f"\n🔍 Querying: '{kw}'")
+    try:
+        refs = _collect_pages(iter_semanticscholar_pages(kw, max_results))
+    except Exception as e:
+        print(f"⚠️ Exception for keyword '{kw}':", e)
+        return None
+
+    if refs is not None:
+        print(f"✅ Found {len(refs)} papers for keyword '{kw}'")
+    return refs
+
+
 def query_semanticscholar(keywords: List[str], max_results: int = 2) -> Dict[str, List[Dict]]:
-    keyword_to_refs = {}
     print(f"Querying Semantic Scholar with up to {max_results} results per keyword...")
+    keyword_to_refs = _query_each(search_semanticscholar, keywords, max_results)
 
-    for kw in keywords:
-        print(f"\n🔍 Querying: '{kw}'")
-        url = f"https://api.semanticscholar.org/graph/v1/paper/search?query={kw}&limit={max_results}&fields=title,authors,year,abstract,url"
+    print("\n📦 Final grouped references:")
+    print(json.dumps(keyword_to_refs, indent=2, ensure_ascii=False, default=to_json))
 
-        try:
-            response = requests.get(url)
-            if response.status_code != 200:
-                print(f"❌ Semantic Scholar query failed for '{kw}' with status {response.status_code}")
-                print("Response content:", response.text)
-                continue
+    return keyword_to_refs
 
-            data = response.json()
-            papers = data.get("data", [])
-            print(f"✅ Found {len(papers)} papers for keyword '{kw}'")
 
-            refs = []
-            for item in papers:
-                refs.append({
-                    "title": item.get("title"),
-                    "authors": [a.get("name") for a in item.get("authors", [])],
-                    "year": item.get("year"),
-                    "abstract": item.get("abstract"),
-                    "url": item.get("url"),
-                    "source": "semanticscholar",
-                })
-            keyword_to_refs[kw] = refs
+# --- Semantic Scholar DOI enrichment ---
+SEMANTICSCHOLAR_BATCH_SIZE = 500  # /paper/batch accepts up to 500 ids
+SEMANTICSCHOLAR_ENRICH_FIELDS = "title,year,abstract,venue,externalIds,url"
+
+
+def enrich_with_semanticscholar(keyword_to_refs):
+    # Fill missing abstract/year/journal of DOI-bearing refs with one /paper/batch call per 500 DOIs
+    by_doi = {}
+    for refs in keyword_to_refs.values():
+        for ref in refs:
+            # Reference DOIs are normalized when the Reference is built
+            if ref.doi:
+                by_doi.setdefault(ref.doi, []).append(ref)
+
+    url = "https://api.semanticscholar.org/graph/v1/paper/batch"
+    dois = list(by_doi)
+    enriched = 0
+    for i in range(0, len(dois), SEMANTICSCHOLAR_BATCH_SIZE):
+        chunk = dois[i:i + SEMANTICSCHOLAR_BATCH_SIZE]
+        body = {"ids": [f"DOI:{doi}" for doi in chunk]}
+        status, papers = post_json("semanticscholar", url, {"fields": SEMANTICSCHOLAR_ENRICH_FIELDS}, body, "paper/batch")
+        if status != 200:
+            print(f"Semantic Scholar batch lookup failed with status {status}")
+            continue
 
+        # The response is aligned with the requested ids, with null for unknown papers
+        for doi, paper in zip(chunk, papers):
+            if not paper:
+                continue
+            for ref in by_doi[doi]:
+                if not ref.abstract and paper.get("abstract"):
+                    ref.abstract = paper["abstract"]
+                if not ref.year and paper.get("year"):
+                    ref.year = paper["year"]
+                if not ref.journal and paper.get("venue"):
+                    ref.journal = paper["venue"]
+            enriched += 1
+
+    print(f"Enriched {enriched} of {len(dois)} DOIs from Semantic Scholar")
+    return keyword_to_refs
+
+
+def _query_each(search, keywords, max_results):
+    keyword_to_refs = {}
+    for kw in keywords:
+        try:
+            refs = search(kw, max_results)
         except Exception as e:
+            # e.g. a request that still timed out after all retries; keep the other keywords
             print(f"⚠️ Exception for keyword '{kw}':", e)
+            continue
+        if refs is not None:
+            keyword_to_refs[kw] = refs
+    return keyword_to_refs
 
-    print("\n📦 Final grouped references:")
-    print(json.dumps(keyword_to_refs, indent=2, ensure_ascii=False))
 
-    return keyword_to_refs
+SEARCH_FUNCTIONS = {
+    "openalex": search_openalex,
+    "crossref": search_crossref,
+    "semanticscholar": search_semanticscholar,
+}
+
+QUERY_FUNCTIONS = {
+    "openalex": query_openalex,
+    "crossref": query_crossref,
+    "semanticscholar": query_semanticscholar,
+}
+
+def fetch_references(keywords, source, max_results=2):
+    if source not in QUERY_FUNCTIONS:
+        raise ValueError(f"Unknown source: {source}")
+    return QUERY_FUNCTIONS[source](keywords, max_results)
+
+
+# --- Concurrent fetching ---
+# Max in-flight requests per source; Semantic Scholar's public API is the strictest
+SOURCE_CONCURRENCY = {
+    "openalex": 8,
+    "crossref": 4,
+    "semanticscholar": 1,
+}
+
+
+def _search_task(source, kws, max_results):
+    # Every task returns {keyword: refs}; OpenAlex tasks may cover a whole batch of keywords
+    if source == "openalex" and len(kws) > 1:
+        return search_openalex_batch(kws, max_results)
+    refs = SEARCH_FUNCTIONS[source](kws[0], max_results)
+    return {} if refs is None else {kws[0]: refs}
+
+
+# Fan out every keyword/source pair at once; returns {source: {keyword: refs}}.
+# batch_size > 1 OR-combines OpenAlex keywords; enrich fills DOI refs from Semantic Scholar.
+# With a budget (seconds), pairs still running at the deadline are abandoned and listed
+# under results[source]["_meta"]["incomplete"]; pairs whose request failed are listed
+# under ["_meta"]["failed"]. on_result(source, {keyword: refs}) is
+# called in the caller's thread as each task finishes. A FetchJournal checkpoints every
+# finished pair and lets a rerun skip the pairs it already holds.
+def fetch_all(keywords, sources=("openalex", "semanticscholar", "crossref"), max_results=2, source_limits=None,
+              batch_size=1, enrich=False, budget=None, on_result=None, journal=None):
+    limits = {**SOURCE_CONCURRENCY, **(source_limits or {})}
+    for source in sources:
+        if source not in SEARCH_FUNCTIONS:
+            raise ValueError(f"Unknown source: {source}")
+
+    results = {source: {} for source in sources}
+    done = journal.load() if journal is not None else {}
+    for (source, kw), refs in done.items():
+        if source in results and kw in keywords:
+            results[source][kw] = refs
+    if done:
+        print(f"Resuming: {sum(len(r) for r in results.values())} keyword/source pairs restored from {journal.path}")
+
+    tasks = []
+    for source in sources:
+        missing = [kw for kw in keywords if kw not in results[source]]
+        step = batch_size if source == "openalex" and batch_size > 1 else 1
+        tasks.extend((source, missing[i:i + step]) for i in range(0, len(missing), step))
+
+    # One pool per source so a slow API only queues behind its own limit
+    executors = {
+        source: ThreadPoolExecutor(max_workers=max(1, min(limits.get(source, 4), len(keywords))))
+        for source in sources
+    }
+    incomplete = {source: [] for source in sources}
+    deadline = time.monotonic() + budget if budget else None
+    timed_out = False
+    try:
+        futures = {
+            executors[source].submit(_search_task, source, kws, max_results): (source, kws)
+            for source, kws in tasks
+        }
+        pending = set(futures)
+        try:
+            timeout = max(0.0, deadline - time.monotonic()) if deadline else None
+            for future in as_completed(futures, timeout=timeout):
+                pending.discard(future)
+                source, kws = futures[future]
+                try:
+                    found = future.result()
+                except Exception as e:
+                    print(f"⚠️ {source} query failed for {kws}:", e)
+                    continue
+                results[source].update(found)
+                if journal is not None:
+                    journal.record(source, found)
+                if on_result is not None:
+                    on_result(source, found)
+        except FuturesTimeoutError:
+            timed_out = True
+            for future in pending:
+                future.cancel()
+                source, kws = futures[future]
+                incomplete[source].extend(kws)
+            print(f"Latency budget of {budget}s exceeded, {len(pending)} requests abandoned")
+    finally:
+        # Stragglers keep their thread until the HTTP timeout, but nobody waits for them
+        for executor in executors.values():
+            executor.shutdown(wait=not timed_out, cancel_futures=timed_out)
+        if journal is not None:
+            journal.close()
+
+    if enrich and not timed_out:
+        for source in sources:
+            if source != "semanticscholar":
+                enrich_with_semanticscholar(results[source])
+
+    # Same keyword order as the sequential query_* functions
+    ordered = {
+        source: {kw: results[source][kw] for kw in keywords if kw in results[source]}
+        for source in sources
+    }
+    for source in sources:
+        meta = {}
+        if incomplete[source]:
+            meta["incomplete"] = [kw for kw in keywords if kw in incomplete[source]]
+            meta["budget_seconds"] = budget
+        failed = [kw for kw in keywords if kw not in results[source] and kw not in incomplete[source]]
+        if failed:
+            meta["failed"] = failed
+        if meta:
+            ordered[source][META_KEY] = meta
+    return ordered
+
+
+def print_cache_stats():
+    cache = get_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
 
 
 # --- Entry Point ---
 if __name__ == "__main__":
+    import argparse
     import sys
-    if len(sys.argv) < 5:
-        print("Usage: python fetch_references.py <keyword_json_file> <output_json_file> <source> <keyword_group>")
-        print("Example: python fetch_references.py keywords/article_1_keywords.json references/article_1_refs.json openalex rake")
-        sys.exit(1)
-
-    keywords_file = sys.argv[1]
-    output_file = sys.argv[2]
-    source = sys.argv[3].lower()
-    keyword_group = sys.argv[4]  # e.g. "rake", "yake", "bert_score"
-
-    with open(keywords_file, "r", encoding="utf-8") as f:
-        keyword_data = json.load(f)
+    from reference_io import NDJSON_SUFFIX, NDJSONReferenceWriter, keyword_items, load_json, save_references
+
+    parser = argparse.ArgumentParser(
+        description="Fetch references for a keyword group.",
+        epilog="Example: python fetch_references.py keywords/article_1_keywords.json references/article_1_refs.json openalex rake",
+    )
+    parser.add_argument("keywords_file")
+    parser.add_argument("output_file", help="with source 'all', a path containing '{source}'; a .ndjson path "
+                                            "is written incrementally as results arrive")
+    parser.add_argument("source", help="openalex, crossref, semanticscholar or all")
+    parser.add_argument("keyword_group", help='e.g. "rake", "yake", "bert_score"')
+    parser.add_argument("max_results", nargs="?", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help=f"OR-combine this many keywords per OpenAlex request (e.g. {OPENALEX_BATCH_SIZE})")
+    parser.add_argument("--enrich", action="store_true",
+                        help="fill missing fields of DOI refs through Semantic Scholar /paper/batch")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="total seconds to wait; late keywords are marked incomplete")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="ignore the checkpoint journal of an earlier interrupted run")
+    args = parser.parse_args()
+
+    output_file = args.output_file
+    source = args.source.lower()
+    keyword_group = args.keyword_group
+    max_results = args.max_results
+
+    keyword_data = load_json(args.keywords_file)
 
     keywords = keyword_data.get(keyword_group, [])
     if not keywords:
         print(f"No keywords found under '{keyword_group}' key in JSON.")
         sys.exit(1)
 
-    max_results = 2
-
-    if source == "openalex":
-        refs = query_openalex(keywords, max_results)
-    elif source == "crossref":
-        refs = query_crossref(keywords, max_results)
-    elif source == "semanticscholar":
-        refs = query_semanticscholar(keywords, max_results)
+    if source == "all":
+        # output_file is a template, e.g. references_raw/article_1_references_{source}_rake.json
+        if "{source}" not in output_file:
+            print("With source 'all' the output path must contain '{source}'.")
+            sys.exit(1)
+        sources = list(QUERY_FUNCTIONS)
+    elif source in QUERY_FUNCTIONS:
+        sources = [source]
     else:
         print(f"Unknown source: {source}")
         sys.exit(1)
 
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(refs, f, indent=2, ensure_ascii=False)
-
-    print(f"References saved to {output_file}")
+    # Finished keyword/source pairs are checkpointed here until every output file is written
+    journal = FetchJournal(
+        output_file.replace("{source}", "all") + ".journal",
+        {"keywords": keywords, "sources": sources, "max_results": max_results, "batch_size": args.batch_size},
+    )
+    if args.no_resume:
+        journal.remove()
+
+    def output_path(name):
+        return output_file.format(source=name) if source == "all" else output_file
+
+    # NDJSON output is appended to as each request finishes, so formatters can follow it.
+    # Enrichment only happens once everything is fetched, so with --enrich it is written at the end.
+    writers = {}
+    if output_file.endswith(NDJSON_SUFFIX) and not args.enrich:
+        writers = {name: NDJSONReferenceWriter(output_path(name)) for name in sources}
+    on_result = (lambda name, found: writers[name].write(found)) if writers else None
+
+    results = fetch_all(keywords, sources, max_results=max_results, batch_size=args.batch_size,
+                        enrich=args.enrich, budget=args.budget, on_result=on_result, journal=journal)
+    for name, refs in results.items():
+        path = output_path(name)
+        if name in writers:
+            # Pairs restored from the journal were never passed to on_result
+            writer = writers[name]
+            writer.write({kw: found for kw, found in keyword_items(refs) if kw not in writer.keywords})
+            writer.close(refs.get(META_KEY))
+        else:
+            save_references(path, refs)
+        print(f"References saved to {path}")
+
+    if any(META_KEY in refs for refs in results.values()):
+        print(f"Some keywords are incomplete or failed; rerun to fetch only those (journal: {journal.path})")
+    else:
+        journal.remove()
+    print_cache_stats()
 
 
 # python scripts/fetch_references.py keywords/article_1_keywords.json references_raw/article_1_references_openalex.json openalex yake
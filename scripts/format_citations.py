@@ -1,103 +1,155 @@
-import json
+import contextlib
+import string
+from reference import Reference
+from reference_io import atomic_path
 
+# The extractors read a Reference (see reference.py); source-specific layouts are
+# resolved once by Reference.from_dict, not on every formatted citation.
 def extract_authors(ref):
-    if "author" in ref and isinstance(ref["author"], str):
-        return ref["author"]
-    elif "authors" in ref:
-        if isinstance(ref["authors"], list):
-            # Case 1: List of dicts (e.g. {"name": "John Doe"})
-            if all(isinstance(a, dict) and "name" in a for a in ref["authors"]):
-                return ", ".join(a.get("name", "") for a in ref["authors"])
-            # Case 2: List of strings
-            elif all(isinstance(a, str) for a in ref["authors"]):
-                return ", ".join(ref["authors"])
-    return "Bilinmeyen Yazar"
+    return ref.author_string() or "Bilinmeyen Yazar"
 
 
 def extract_doi(ref):
-    if "doi" in ref:
-        return ref["doi"]
-    elif "externalIds" in ref and "DOI" in ref["externalIds"]:
-        return ref["externalIds"]["DOI"]
-    return ""
+    return ref.doi or ""
 
 def extract_journal(ref):
-    if "journal" in ref:
-        return ref["journal"]
-    elif "venue" in ref:
-        return ref["venue"]
-    return ""
+    return ref.journal or ""
 
 def extract_year(ref):
-    return ref.get("year", "n.d.")
+    return ref.year or "n.d."
 
 def extract_title(ref):
-    return ref.get("title", "Başlıksız")
+    return ref.title or "Başlıksız"
 
-def format_apa(ref):
-    authors = extract_authors(ref)
-    year = extract_year(ref)
-    title = extract_title(ref)
+# Fields a template can use, in the order citation_fields() returns them
+FIELD_NAMES = ("authors", "year", "title", "journal", "doi", "journal_sentence", "doi_suffix")
+
+def citation_fields(ref):
+    # Every template field, extracted once per reference for all styles
     journal = extract_journal(ref)
     doi = extract_doi(ref)
-    
-    citation = f"{authors} ({year}). {title}."
-    if journal:
-        citation += f" {journal}."
-    if doi:
-        citation += f" doi:{doi}"
-    return citation
+    return (
+        extract_authors(ref),
+        extract_year(ref),
+        extract_title(ref),
+        journal,
+        doi,
+        # Optional segments, empty when the field is missing
+        f" {journal}." if journal else "",
+        f" doi:{doi}" if doi else "",
+    )
+
+def compile_template(template):
+    # "{authors} ({year})." -> "{0} ({1}).".format, called with the citation_fields() tuple.
+    # Field names are checked once and replaced by their position, so a template can only
+    # read FIELD_NAMES (no attribute or index lookups), and format specs may not contain
+    # nested fields.
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        parts.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if field not in FIELD_NAMES:
+            raise ValueError(f"Unknown citation field: {field!r}")
+        if conversion not in (None, "s", "r", "a"):
+            raise ValueError(f"Invalid conversion in citation template: {conversion!r}")
+        if spec and ("{" in spec or "}" in spec):
+            raise ValueError(f"Nested fields are not allowed in citation templates: {spec!r}")
+        parts.append("{" + str(FIELD_NAMES.index(field)) + (f"!{conversion}" if conversion else "")
+                     + (f":{spec}" if spec else "") + "}")
+    return "".join(parts).format
+
+# Templates over FIELD_NAMES; add a style with register_style()
+STYLE_TEMPLATES = {
+    "apa": "{authors} ({year}). {title}.{journal_sentence}{doi_suffix}",
+    "mla": "{authors}. \"{title}.\" {journal}, {year}.",
+    "chicago": "{authors}. \"{title}.\" {journal} ({year}).",
+}
+
+_RENDERERS = {style: compile_template(template) for style, template in STYLE_TEMPLATES.items()}
+
+CITATION_SEPARATOR = "\n\n"
+
+def register_style(style, template):
+    _RENDERERS[style] = compile_template(template)
+    STYLE_TEMPLATES[style] = template
+    FORMATTERS[style] = lambda ref: _RENDERERS[style](*citation_fields(ref))
+
+def render_citations(references, styles=("apa", "mla", "chicago")):
+    # Yields {style: citation} per reference, lazily, in one pass over the references
+    renderers = [(style, _RENDERERS[style]) for style in styles]
+    for ref in references:
+        fields = citation_fields(Reference.from_dict(ref))
+        yield {style: render(*fields) for style, render in renderers}
+
+def format_apa(ref):
+    return _RENDERERS["apa"](*citation_fields(ref))
 
 def format_mla(ref):
-    authors = extract_authors(ref)
-    title = extract_title(ref)
-    journal = extract_journal(ref)
-    year = extract_year(ref)
-    citation = f"{authors}. \"{title}.\" {journal}, {year}."
-    return citation
+    return _RENDERERS["mla"](*citation_fields(ref))
 
 def format_chicago(ref):
-    authors = extract_authors(ref)
-    title = extract_title(ref)
-    journal = extract_journal(ref)
-    year = extract_year(ref)
-    citation = f"{authors}. \"{title}.\" {journal} ({year})."
-    return citation
+    return _RENDERERS["chicago"](*citation_fields(ref))
+
+FORMATTERS = {
+    "apa": format_apa,
+    "mla": format_mla,
+    "chicago": format_chicago,
+}
+
+def format_references(references, styles=("apa", "mla", "chicago")):
+    # In-memory {style: [citations]}; use stream_citations for large bibliographies
+    citations = {style: [] for style in styles}
+    for rendered in render_citations(references, styles):
+        for style, citation in rendered.items():
+            citations[style].append(citation)
+    return citations
+
+def stream_citations(references, output_prefix, styles=("apa", "mla", "chicago")):
+    # Renders every style in one pass and writes each citation as soon as it is rendered,
+    # so memory stays flat however many references there are. Each file replaces the old one
+    # only once complete. Returns the number written.
+    count = 0
+    with contextlib.ExitStack() as stack:
+        files = []
+        for style in styles:
+            tmp_path = stack.enter_context(atomic_path(f"{output_prefix}_{style}.txt"))
+            f = stack.enter_context(open(tmp_path, "w", encoding="utf-8", buffering=1 << 20))
+            files.append((f.write, _RENDERERS[style]))
+        separator = ""
+        for ref in references:
+            fields = citation_fields(Reference.from_dict(ref))
+            for write, render in files:
+                write(separator + render(*fields))
+            separator = CITATION_SEPARATOR
+            count += 1
+    return count
+
+def write_citations(citations, output_prefix):
+    for style, formatted in citations.items():
+        with atomic_path(f"{output_prefix}_{style}.txt") as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+            for i, citation in enumerate(formatted):
+                if i:
+                    f.write(CITATION_SEPARATOR)
+                f.write(citation)
 
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) < 3:
-        print("Usage: python format_citations.py <references_json_file> <output_prefix>")
+    from reference_io import iter_reference_file
+
+    # --follow: keep reading a .ndjson file that is still being fetched until it is complete
+    follow = "--follow" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--follow"]
+    if len(args) < 2:
+        print("Usage: python format_citations.py <references_json_or_ndjson_file> <output_prefix> [--follow]")
         sys.exit(1)
     
-    ref_file = sys.argv[1]
-    output_prefix = sys.argv[2]
-
-    with open(ref_file, "r", encoding="utf-8") as f:
-        references_raw = json.load(f)
-
-    # Flatten if the JSON is grouped by keywords (dict of lists)
-    if isinstance(references_raw, dict):
-        references = []
-        for refs_list in references_raw.values():
-            references.extend(refs_list)
-    else:
-        references = references_raw
-
-    apa_citations = [format_apa(r) for r in references]
-    mla_citations = [format_mla(r) for r in references]
-    chicago_citations = [format_chicago(r) for r in references]
-
-    with open(f"{output_prefix}_apa.txt", "w", encoding="utf-8") as f:
-        f.write("\n\n".join(apa_citations))
-
-    with open(f"{output_prefix}_mla.txt", "w", encoding="utf-8") as f:
-        f.write("\n\n".join(mla_citations))
+    ref_file = args[0]
+    output_prefix = args[1]
 
-    with open(f"{output_prefix}_chicago.txt", "w", encoding="utf-8") as f:
-        f.write("\n\n".join(chicago_citations))
+    stream_citations(iter_reference_file(ref_file, follow), output_prefix)
 
     print(f"Citations formatted and saved as {output_prefix}_{{apa,mla,chicago}}.txt")
 
 
-# python scripts/format_citations.py references_raw/article_1_references_openalex.json citations_formatted/article_1_openalex
\ No newline at end of file
+# python scripts/format_citations.py references_raw/article_1_references_openalex.json citations_formatted/article_1_openalex
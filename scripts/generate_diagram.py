@@ -2,24 +2,29 @@ import json
 import sys
 import networkx as nx
 import plotly.graph_objects as go
+from reference_io import keyword_items, as_references, atomic_path
 
 def generate_plotly_graph(input_json_path, output_html_path):
     with open(input_json_path, "r", encoding="utf-8") as f:
         data = json.load(f)
+    plot_references(as_references(data), output_html_path)
 
+
+def plot_references(data, output_html_path):
+    # data: {keyword: [Reference]}
     G = nx.DiGraph()
 
     # Add keyword nodes
-    keywords = list(data.keys())
+    keywords = [keyword for keyword, _ in keyword_items(data)]
     for keyword in keywords:
         G.add_node(keyword, type='keyword')
 
     # Add reference nodes
     ref_nodes = []
-    for keyword, refs in data.items():
+    for keyword, refs in keyword_items(data):
         for i, ref in enumerate(refs):
             ref_id = f"{keyword}_ref_{i}"
-            title = ref.get('title', f'Untitled {i}')
+            title = ref.title or f'Untitled {i}'
             G.add_node(ref_id, label=title, type='ref')
             G.add_edge(keyword, ref_id)
             ref_nodes.append(ref_id)
@@ -86,7 +91,8 @@ def generate_plotly_graph(input_json_path, output_html_path):
                         xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
                         yaxis=dict(showgrid=False, zeroline=False, showticklabels=False))
                    )
-    fig.write_html(output_html_path)
+    with atomic_path(output_html_path) as tmp_path:
+        fig.write_html(tmp_path)
     print(f"✅ Interactive Plotly graph saved to: {output_html_path}")
 
 
@@ -3,31 +3,44 @@ import sys
 import os
 import networkx as nx
 import plotly.graph_objects as go
+from reference_io import load_references, keyword_items, atomic_path
+from reference_store import get_store
 
-def generate_pipeline_graph(article_path, output_html_path):
-    article_base = os.path.splitext(os.path.basename(article_path))[0]
+all_keyword_groups = ["rake", "yake", "bert_score"]
+sources = ["openalex", "semanticscholar", "crossref"]
 
+def load_pipeline_data(article_base):
     # Load keywords
     keywords_path = f"keywords/{article_base}_keywords.json"
     if not os.path.exists(keywords_path):
-        print(f"Keywords file not found: {keywords_path}")
-        sys.exit(1)
+        raise FileNotFoundError(f"Keywords file not found: {keywords_path}")
     with open(keywords_path, "r", encoding="utf-8") as f:
         keywords_data = json.load(f)
 
-    all_keyword_groups = ["rake", "yake", "bert_score"]
-    sources = ["openalex", "semanticscholar", "crossref"]
-
-    # Load all reference files
+    # Only titles are needed: read from the reference store without decompressing any references,
+    # falling back to the JSON files written before the store existed
+    stored = get_store().titles(article_base)
     references = {group: {source: {} for source in sources} for group in all_keyword_groups}
     for group in all_keyword_groups:
         for source in sources:
+            if source in stored.get(group, {}):
+                references[group][source] = stored[group][source]
+                continue
             ref_path = f"references_raw/{article_base}_references_{source}_{group}.json"
             if not os.path.exists(ref_path):
-                print(f"Warning : Reference file not found: {ref_path}")
+                print(f"Warning : References not found for {source}/{group}")
                 continue
-            with open(ref_path, "r", encoding="utf-8") as f:
-                references[group][source] = json.load(f)
+            references[group][source] = {kw: [ref.title for ref in refs]
+                                         for kw, refs in keyword_items(load_references(ref_path))}
+
+    return keywords_data, references
+
+
+def generate_pipeline_graph(article_path, output_html_path, keywords_data=None, references=None):
+    article_base = os.path.splitext(os.path.basename(article_path))[0]
+
+    if keywords_data is None or references is None:
+        keywords_data, references = load_pipeline_data(article_base)
 
     G = nx.DiGraph()
 
@@ -61,9 +74,9 @@ def generate_pipeline_graph(article_path, output_html_path):
             for source in sources:
                 ref_data = references[method].get(source, {})
                 refs = ref_data.get(kw, [])
-                for k, ref in enumerate(refs):
+                for k, title in enumerate(refs):
                     ref_id = f"ref_{source}_{method}_{kw_idx}_{k}"
-                    ref_title = ref.get("title", f"Ref {k}")
+                    ref_title = title or f"Ref {k}"
                     G.add_node(ref_id, label=ref_title, type='reference', x=3, y=ref_y_counter)
                     G.add_edge(kw_node, ref_id)
                     G.add_edge(ref_id, source)
@@ -128,7 +141,8 @@ def generate_pipeline_graph(article_path, output_html_path):
                         yaxis=dict(showgrid=False, zeroline=False, showticklabels=False))
                    )
 
-    fig.write_html(output_html_path)
+    with atomic_path(output_html_path) as tmp_path:
+        fig.write_html(tmp_path)
     print(f"Pipeline graph saved to: {output_html_path}")
 
 if __name__ == "__main__":
@@ -136,6 +150,10 @@ if __name__ == "__main__":
         print("Usage: python scripts/generate_pipeline_graph.py <article_path> <output_html>")
         sys.exit(1)
 
-    generate_pipeline_graph(sys.argv[1], sys.argv[2])
+    try:
+        generate_pipeline_graph(sys.argv[1], sys.argv[2])
+    except FileNotFoundError as e:
+        print(e)
+        sys.exit(1)
 
 # python scripts/generate_pipeline_graph.py articles/article_1.txt diagrams/article_1_pipeline.html
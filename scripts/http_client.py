@@ -0,0 +1,143 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (requests per second, burst) per source; the public Semantic Scholar API allows ~1 rps
+SOURCE_RATE_LIMITS = {
+    "openalex": (10.0, 10),
+    "crossref": (5.0, 5),
+    "semanticscholar": (1.0, 1),
+}
+DEFAULT_RATE_LIMIT = (5.0, 5)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_TIMEOUT = (5.0, 30.0)  # (connect, read) seconds
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF = 1.0  # seconds, doubled on every retry
+MAX_BACKOFF = 60.0
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # Drain the bucket so other threads also respect a server-requested Retry-After
+        with self._lock:
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ApiClient:
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff=DEFAULT_BACKOFF, rate_limits=None, pool_size=16):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        # Keep-alive connections shared by every fetcher thread
+        adapter = HTTPAdapter(pool_connections=len(SOURCE_RATE_LIMITS), pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        limits = {**SOURCE_RATE_LIMITS, **(rate_limits or {})}
+        self.buckets = {source: TokenBucket(*limit) for source, limit in limits.items()}
+        self._buckets_lock = threading.Lock()
+
+    def _bucket(self, source):
+        with self._buckets_lock:
+            if source not in self.buckets:
+                self.buckets[source] = TokenBucket(*DEFAULT_RATE_LIMIT)
+            return self.buckets[source]
+
+    def _delay(self, attempt, response=None):
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, MAX_BACKOFF)
+        return min(self.backoff * (2 ** attempt), MAX_BACKOFF) * (0.5 + random.random() / 2)
+
+    def request(self, source, method, url, **kwargs):
+        bucket = self._bucket(source)
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._delay(attempt)
+                print(f"{source}: {type(e).__name__}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+
+            delay = self._delay(attempt, response)
+            if response.status_code == 429:
+                bucket.pause(delay)
+            print(f"{source}: status {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def get(self, source, url, params=None, **kwargs):
+        return self.request(source, "GET", url, params=params, **kwargs)
+
+    def post(self, source, url, params=None, json=None, **kwargs):
+        return self.request(source, "POST", url, params=params, json=json, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def scaled_rate_limits(scale):
+    return {source: (rate * scale, max(1, int(burst * scale))) for source, (rate, burst) in SOURCE_RATE_LIMITS.items()}
+
+
+def get_client():
+    # Timeouts and retries can be tuned with HTTP_TIMEOUT (read seconds) and HTTP_MAX_RETRIES.
+    # HTTP_RATE_SCALE gives this process a fraction of the per-source rate limits, so that
+    # several worker processes together stay within them.
+    global _client
+    with _client_lock:
+        if _client is None:
+            scale = float(os.environ.get("HTTP_RATE_SCALE", 1))
+            _client = ApiClient(
+                timeout=(DEFAULT_TIMEOUT[0], float(os.environ.get("HTTP_TIMEOUT", DEFAULT_TIMEOUT[1]))),
+                max_retries=int(os.environ.get("HTTP_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+                rate_limits=scaled_rate_limits(scale) if scale != 1 else None,
+            )
+        return _client
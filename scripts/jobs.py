@@ -0,0 +1,137 @@
+import itertools
+import json
+from collections import deque
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Background jobs for the Streamlit app. Pipeline steps run on one bounded thread pool per
+# server process instead of inside a session's script run, so a long step neither blocks its
+# session nor piles up when many sessions click at once: a step that is already queued or
+# running with the same parameters is shared instead of started again. Sessions poll the
+# jobs of their article and render results once they are done.
+DEFAULT_JOB_WORKERS = 4
+FINISHED_JOB_TTL = 3600  # seconds a finished job stays listed
+MAX_JOB_ITEMS = 200  # partial results kept per job; older ones are dropped
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    # fn(job, ...) reports through job.update(); everything else is set by the runner
+    def __init__(self, job_id, article, step, key):
+        self.id = job_id
+        self.article = article
+        self.step = step
+        self.key = key
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.items = deque(maxlen=MAX_JOB_ITEMS)  # latest partial results, e.g. references as they arrive
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def update(self, progress=None, message=None, items=()):
+        with self._lock:
+            if progress is not None:
+                self.progress = max(0.0, min(1.0, progress))
+            if message is not None:
+                self.message = message
+            self.items.extend(items)
+
+    def _set(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def snapshot(self):
+        # A consistent copy for the UI thread
+        with self._lock:
+            return {"id": self.id, "article": self.article, "step": self.step, "status": self.status,
+                    "progress": self.progress, "message": self.message, "items": list(self.items),
+                    "result": self.result, "error": self.error, "submitted": self.submitted,
+                    "started": self.started, "finished": self.finished}
+
+
+class JobRunner:
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="pipeline-job")
+        self._jobs = {}
+        self._active = {}  # (article, step, params) -> queued or running job
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, article, step, fn, *args, params=None, **kwargs):
+        # Runs fn(job, *args, **kwargs) in the background. params identifies the request: the same
+        # article, step and params while a job is still queued or running returns that job.
+        key = (article, step, json.dumps(params, sort_keys=True, default=str))
+        with self._lock:
+            existing = self._active.get(key)
+            if existing is not None:
+                return existing
+            self._prune()
+            job = Job(f"{step}-{next(self._ids)}", article, step, key)
+            self._jobs[job.id] = job
+            self._active[key] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job._set(status=RUNNING, started=time.time())
+        try:
+            result = fn(job, *args, **kwargs)
+            job._set(status=DONE, result=result, progress=1.0, finished=time.time())
+        except Exception as e:
+            traceback.print_exc()
+            job._set(status=FAILED, error=f"{type(e).__name__}: {e}", finished=time.time())
+        finally:
+            with self._lock:
+                self._active.pop(job.key, None)
+
+    def _prune(self):
+        cutoff = time.time() - FINISHED_JOB_TTL
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if not job.active and job.finished is not None and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, article=None):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job for job in jobs if article is None or job.article == article]
+
+    def stats(self):
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in self.jobs():
+            counts[job.status] += 1
+        return {**counts, "workers": self.max_workers}
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    # Pool size configurable with JOB_WORKERS
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(int(os.environ.get("JOB_WORKERS", DEFAULT_JOB_WORKERS)))
+        return _runner
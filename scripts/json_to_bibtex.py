@@ -1,24 +1,74 @@
 import json
+import os
+import re
+import threading
+import unicodedata
+from reference import Reference
+from reference_io import atomic_path
 
-def json_to_bibtex_entry(ref, index):
-    # Handle author list
-    authors_list = []
-    if isinstance(ref.get("author"), list):
-        for author in ref["author"]:
-            name = author.get("name") or f"{author.get('given', '')} {author.get('family', '')}".strip()
-            if name:
-                authors_list.append(name)
-    elif isinstance(ref.get("author"), str):
-        authors_list = [a.strip() for a in ref["author"].split(",")]
-
-    authors = " and ".join(authors_list)
-
-    title = ref.get("title", "")
-    journal = ref.get("venue") or ref.get("journal", "")
-    year = ref.get("year") or ref.get("publicationYear", "")
-    doi = ref.get("doi", "") or ref.get("externalIds", {}).get("DOI", "")
-    
-    bibtex = f"@article{{ref{index},\n"
+# Citation keys are derived from the content (first author, year, first title word), e.g.
+# smith2020deep, so they survive re-exports; a clash with a different paper gets a/b/c... appended.
+
+LATEX_ESCAPES = str.maketrans({
+    "\\": r"\textbackslash{}", "{": r"\{", "}": r"\}", "&": r"\&", "%": r"\%", "$": r"\$",
+    "#": r"\#", "_": r"\_", "~": r"\textasciitilde{}", "^": r"\textasciicircum{}",
+})
+_UNESCAPE_RE = re.compile(r"\\textbackslash\{\}|\\textasciitilde\{\}|\\textasciicircum\{\}|\\([{}&%$#_])")
+_UNESCAPES = {r"\textbackslash{}": "\\", r"\textasciitilde{}": "~", r"\textasciicircum{}": "^"}
+KEY_STOPWORDS = {"a", "an", "the", "on", "of", "in", "for", "and", "to", "with", "from", "by", "at", "towards"}
+
+INDEX_SUFFIX = ".index"  # sidecar of a merged .bib: one [identities, key, end offset] line per entry
+WRITE_BUFFER = 1 << 20
+
+_merge_locks = {}
+_merge_locks_lock = threading.Lock()
+
+def _merge_lock(bib_file):
+    # Merges into the same library from several threads (app jobs) take turns
+    with _merge_locks_lock:
+        return _merge_locks.setdefault(os.path.abspath(bib_file), threading.Lock())
+
+def latex_escape(text):
+    return str(text).translate(LATEX_ESCAPES)
+
+def latex_unescape(text):
+    return _UNESCAPE_RE.sub(lambda m: m.group(1) or _UNESCAPES[m.group()], text)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def _ascii_words(text):
+    if not text:
+        return []
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return _WORD_RE.findall(text.lower())
+
+def _family_name(author):
+    # "Smith, John" or "John Smith"
+    return author.split(",")[0] if "," in author else author.split()[-1]
+
+def citation_key(ref):
+    family = "".join(_ascii_words(_family_name(ref.authors[0]))) if ref.authors and ref.authors[0].strip() else ""
+    title_word = next((word for word in _ascii_words(ref.title) if word not in KEY_STOPWORDS), "")
+    return f"{family or 'anon'}{ref.year or 'nd'}{title_word[:20]}"
+
+def reference_identities(ref):
+    # A reference is one bibliography entry with any reference sharing its DOI or its title|year
+    identities = [f"doi:{ref.doi}"] if ref.doi else []
+    words = _ascii_words(ref.title)
+    if words or not identities:
+        identities.append(f"title:{' '.join(words)}|{ref.year or ''}")
+    return identities
+
+def bibtex_entry(ref, key):
+    authors = latex_escape(ref.author_string(" and "))
+    title = latex_escape(ref.title or "")
+    journal = latex_escape(ref.journal or "")
+    year = ref.year or ""
+    # DOIs are verbatim in BibTeX; only braces would break the entry
+    doi = (ref.doi or "").replace("{", "").replace("}", "")
+
+    bibtex = f"@article{{{key},\n"
     if authors:
         bibtex += f"  author = {{{authors}}},\n"
     if title:
@@ -33,30 +83,220 @@ def json_to_bibtex_entry(ref, index):
 
     return bibtex
 
+def json_to_bibtex_entry(ref, index):
+    # ref: a Reference or a reference dict in any source layout; positional key ref<index>
+    return bibtex_entry(Reference.from_dict(ref), f"ref{index}")
+
+class BibliographyIndex:
+    # Keys and identities already in a bibliography. Each entry is found under its DOI and its
+    # title|year, so a paper seen with and without a DOI is listed once; a title match never
+    # joins two different DOIs.
+    def __init__(self):
+        self.keys = set()
+        self.identities = {}
+        self.dois = {}  # key -> the entry's DOI identity
+
+    def link(self, identities, key):
+        # Points the identities that are not indexed yet at key
+        for identity in identities:
+            self.identities.setdefault(identity, key)
+            if identity.startswith("doi:"):
+                self.dois.setdefault(key, identity)
+
+    def find(self, identities):
+        doi = next((identity for identity in identities if identity.startswith("doi:")), None)
+        for identity in identities:
+            key = self.identities.get(identity)
+            if key is not None and (doi is None or self.dois.get(key, doi) == doi):
+                return key
+        return None
+
+    def add(self, ref, identities=None):
+        # The new entry's key, or None if the reference is already listed
+        identities = identities or reference_identities(ref)
+        existing = self.find(identities)
+        if existing is not None:
+            self.link(identities, existing)
+            return None
+        base = citation_key(ref)
+        key, suffix = base, 0
+        while key in self.keys:
+            key = base + _key_suffix(suffix)
+            suffix += 1
+        self.keys.add(key)
+        self.link(identities, key)
+        return key
+
+def _key_suffix(n):
+    # a, b, ..., z, aa, ab, ...
+    letters = ""
+    n += 1
+    while n:
+        n, rest = divmod(n - 1, 26)
+        letters = chr(ord("a") + rest) + letters
+    return letters
+
+def references_to_bibtex(references):
+    index = BibliographyIndex()
+    entries = []
+    for ref in references:
+        ref = Reference.from_dict(ref)
+        key = index.add(ref)
+        if key is not None:
+            entries.append(bibtex_entry(ref, key) + "\n")
+    return "".join(entries)
+
+_ENTRY_RE = re.compile(r"^@\w+\s*\{\s*([^,\s]+)\s*,", re.MULTILINE)
+_FIELD_RE = re.compile(r"^\s*(\w+)\s*=\s*\{(.*)\},?\s*$", re.MULTILINE)
+
+def scan_bibtex(bib_file):
+    # Rebuilds the index of an existing .bib (hand-edited, or written without a sidecar)
+    index = BibliographyIndex()
+    with open(bib_file, "r", encoding="utf-8") as f:
+        text = f.read()
+    starts = [m.start() for m in _ENTRY_RE.finditer(text)] + [len(text)]
+    for start, end in zip(starts, starts[1:]):
+        chunk = text[start:end]
+        key = _ENTRY_RE.match(chunk).group(1)
+        fields = {name.lower(): latex_unescape(value) for name, value in _FIELD_RE.findall(chunk)}
+        ref = Reference(title=fields.get("title"), year=fields.get("year"), doi=fields.get("doi"))
+        index.keys.add(key)
+        if ref.doi or ref.title:
+            index.link(reference_identities(ref), key)
+    return index
+
+class BibTeXWriter:
+    # Buffered writer for a .bib file. With merge=True the file is appended to and references
+    # already in it are skipped, so re-exporting a large library costs only the new entries.
+    # The sidecar <bib>.index makes that check cheap; it is rebuilt from the .bib when it
+    # does not match (the .bib was edited, or a previous run was interrupted).
+    # Without merge, the file is written under a temp name and replaces the old one on close.
+    def __init__(self, bib_file, merge=False):
+        self.bib_file = bib_file
+        self.index_file = bib_file + INDEX_SUFFIX
+        self.index = BibliographyIndex()
+        self.written = 0
+        parent = os.path.dirname(bib_file)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._lock = _merge_lock(bib_file) if merge else None
+        self._atomic = None if merge else atomic_path(bib_file)
+        if self._lock is not None:
+            self._lock.acquire()
+        try:
+            self._open(merge)
+        except BaseException:
+            if self._lock is not None:
+                self._lock.release()
+            raise
+
+    def _open(self, merge):
+        bib_file = self.bib_file
+        self.offset = os.path.getsize(bib_file) if merge and os.path.exists(bib_file) else 0
+        rewrite_index = True
+        if self.offset:
+            loaded = self._load_index()
+            if loaded is not None:
+                self.index, rewrite_index = loaded, False
+            else:
+                self.index = scan_bibtex(bib_file)
+
+        mode = "a" if self.offset else "w"
+        target = self._atomic.__enter__() if self._atomic is not None else bib_file
+        self._bib = open(target, mode, encoding="utf-8", newline="\n", buffering=WRITE_BUFFER)
+        self._index = None
+        if merge:
+            self._index = open(self.index_file, "w" if rewrite_index else "a", encoding="utf-8", newline="\n",
+                               buffering=WRITE_BUFFER)
+        if merge and rewrite_index:
+            identities = {}
+            for identity, key in self.index.identities.items():
+                identities.setdefault(key, []).append(identity)
+            for key in self.index.keys:
+                self._index.write(json.dumps([identities.get(key, []), key, self.offset]) + "\n")
+
+    def _load_index(self):
+        if not os.path.exists(self.index_file):
+            return None
+        index = BibliographyIndex()
+        end = None
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    identities, key, end = json.loads(line)
+                except ValueError:
+                    return None
+                if not isinstance(identities, list):
+                    return None  # one identity per entry, written before entries had two: rescan
+                index.keys.add(key)
+                index.link(identities, key)
+        return index if end == self.offset else None
+
+    def add(self, ref):
+        # Returns the entry's key, or None if the reference is already in the bibliography
+        ref = Reference.from_dict(ref)
+        identities = reference_identities(ref)
+        new = [identity for identity in identities if identity not in self.index.identities]
+        key = self.index.add(ref, identities)
+        if key is None:
+            if new and self._index is not None:
+                # e.g. the DOI of an entry first listed without one
+                self._index.write(json.dumps([new, self.index.identities[new[0]], self.offset]) + "\n")
+            return None
+        entry = bibtex_entry(ref, key) + "\n"
+        self._bib.write(entry)
+        if self._index is not None:
+            self.offset += len(entry.encode("utf-8"))
+            self._index.write(json.dumps([identities, key, self.offset]) + "\n")
+        self.written += 1
+        return key
+
+    def close(self, exc_info=(None, None, None)):
+        # The .bib is flushed first: an index that runs ahead of it is never left behind
+        try:
+            self._bib.close()
+            if self._index is not None:
+                self._index.close()
+        finally:
+            if self._atomic is not None:
+                self._atomic.__exit__(*exc_info)  # renames, or removes the temp file after an error
+            if self._lock is not None:
+                self._lock.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close(exc_info)
+
+def write_bibtex(references, bib_file, merge=False):
+    # Writes entries as the references arrive; returns the number of new entries
+    with BibTeXWriter(bib_file, merge) as writer:
+        for ref in references:
+            writer.add(ref)
+    return writer.written
+
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) < 3:
-        print("Usage: python json_to_bibtex.py <references_json_file> <output_bib_file>")
-        sys.exit(1)
-    
-    ref_file = sys.argv[1]
-    bib_file = sys.argv[2]
+    from itertools import chain
+    from reference_io import iter_reference_file
 
-    with open(ref_file, "r", encoding="utf-8") as f:
-        references_raw = json.load(f)
+    # --follow: keep reading a .ndjson file that is still being fetched until it is complete
+    # --merge: append only references that are not already in <output_bib_file>
+    follow = "--follow" in sys.argv
+    merge = "--merge" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg not in ("--follow", "--merge")]
+    if len(args) < 2:
+        print("Usage: python json_to_bibtex.py <references_json_or_ndjson_file>... <output_bib_file> "
+              "[--merge] [--follow]")
+        sys.exit(1)
 
-    # Flatten dict of lists to a single list
-    if isinstance(references_raw, dict):
-        references = []
-        for refs_list in references_raw.values():
-            references.extend(refs_list)
-    else:
-        references = references_raw
+    ref_files = args[:-1]
+    bib_file = args[-1]
 
-    with open(bib_file, "w", encoding="utf-8") as f:
-        for i, ref in enumerate(references):
-            entry = json_to_bibtex_entry(ref, i + 1)
-            f.write(entry + "\n")
+    references = chain.from_iterable(iter_reference_file(path, follow) for path in ref_files)
+    written = write_bibtex(references, bib_file, merge)
 
-    print(f"BibTeX entries saved to {bib_file}")
+    print(f"{written} BibTeX entries {'added to' if merge else 'saved to'} {bib_file}")
 
+# python scripts/json_to_bibtex.py references_raw/article_*_references_merged_rake.json citations_formatted/library.bib --merge
@@ -0,0 +1,392 @@
+"""In-process pipeline API.
+
+Each stage works on in-memory objects so ``app.py`` can call it directly
+instead of spawning ``python scripts/...`` per click. Stage modules are
+imported on first use and then stay loaded for the life of the process.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from reference_io import (
+    load_json, save_json, load_references, keyword_items, flatten_references, incomplete_keywords, FetchJournal,
+    META_KEY,
+)
+
+SOURCES = ["openalex", "semanticscholar", "crossref"]
+# "merged" holds the deduplicated references of all sources (see dedup.py)
+MERGED = "merged"
+ENGINES = SOURCES + [MERGED]
+# Citations, BibTeX and diagrams are made from the merged references by default, so their cost
+# follows the number of unique papers; pass engines=ENGINES for per-source outputs as well
+OUTPUT_ENGINES = [MERGED]
+KEYWORD_GROUPS = ["rake", "yake", "bert_score"]
+CITATION_FORMATS = ["apa", "mla", "chicago"]
+
+
+# --- Paths ---
+def keywords_path(article_base):
+    return f"keywords/{article_base}_keywords.json"
+
+
+def references_path(article_base, source, keyword_group):
+    return f"references_raw/{article_base}_references_{source}_{keyword_group}.json"
+
+
+def citations_prefix(article_base, engine, keyword_group):
+    return f"citations_formatted/{article_base}_{engine}_{keyword_group}"
+
+
+def bibtex_path(article_base, engine, keyword_group):
+    return f"{citations_prefix(article_base, engine, keyword_group)}.bib"
+
+
+def diagram_path(article_base, source, keyword_group):
+    return f"diagrams/{article_base}_{source}_{keyword_group}_plotly.html"
+
+
+def pipeline_diagram_path(article_base):
+    return f"diagrams/{article_base}_pipeline.html"
+
+
+def fetch_journal_path(article_base, keyword_group):
+    return f"references_raw/{article_base}_{keyword_group}.fetch.journal"
+
+
+# --- Stages (in-memory) ---
+def extract_keywords(text, candidates="rake_yake", diversity=None):
+    import extract_keywords as stage
+    return stage.extract_all(text, candidates, diversity)
+
+
+def fetch_references(keywords, source, max_results=2):
+    import fetch_references as stage
+    return stage.fetch_references(keywords, source, max_results)
+
+
+def fetch_all_references(keywords, sources=SOURCES, max_results=2, batch_size=1, enrich=False,
+                         budget=None, on_result=None, journal=None):
+    import fetch_references as stage
+    return stage.fetch_all(keywords, sources, max_results, batch_size=batch_size, enrich=enrich,
+                           budget=budget, on_result=on_result, journal=journal)
+
+
+def format_citations(references, styles=CITATION_FORMATS):
+    import format_citations as stage
+    return stage.format_references(flatten_references(references), styles)
+
+
+def references_to_bibtex(references):
+    import json_to_bibtex as stage
+    return stage.references_to_bibtex(flatten_references(references))
+
+
+def plot_references(references, output_html_path):
+    import generate_diagram as stage
+    os.makedirs(os.path.dirname(output_html_path), exist_ok=True)
+    stage.plot_references(references, output_html_path)
+
+
+def plot_pipeline(article_path, output_html_path, keywords_data, references):
+    import generate_pipeline_graph as stage
+    os.makedirs(os.path.dirname(output_html_path), exist_ok=True)
+    stage.generate_pipeline_graph(article_path, output_html_path, keywords_data, references)
+
+
+def deduplicate(references_by_source, keywords=None):
+    import dedup as stage
+    return stage.deduplicate(references_by_source, keywords)
+
+
+def cache_stats():
+    from response_cache import get_cache
+    cache = get_cache()
+    return cache.stats() if cache is not None else None
+
+
+# --- Stage manifest (memoization) ---
+# Every article-level step is a node of a small DAG:
+#   article -> keywords -> references (group, source) -> citations (style) / bibtex / diagram
+#   article + keywords + all references -> pipeline graph
+# Each node records a hash of its parameters and input contents (files, reference store
+# entries); it is skipped while that hash is unchanged and its outputs still exist.
+MANIFEST_DIR = ".cache/manifests"
+_manifest_lock = threading.Lock()
+
+
+def file_digest(path):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_digest(stage, params, inputs=(), digests=()):
+    # inputs: file paths whose content the stage reads; digests: content digests of other inputs
+    # (reference store entries)
+    raw = json.dumps([stage, params, [file_digest(path) for path in inputs], list(digests)],
+                     sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class StageManifest:
+    # One JSON file per article, so batch workers never write the same manifest. Within a
+    # process (background jobs of the app), writes re-read the file under a lock so steps of
+    # the same article running at once keep each other's entries.
+    def __init__(self, article_base, directory=MANIFEST_DIR):
+        self.path = os.path.join(directory, f"{article_base}.json")
+        self.entries = self._load()
+
+    def _load(self):
+        return load_json(self.path) if os.path.exists(self.path) else {}
+
+    def is_fresh(self, key, digest, outputs):
+        entry = self.entries.get(key)
+        return entry is not None and entry["digest"] == digest and all(os.path.exists(p) for p in outputs)
+
+    def record(self, key, digest, outputs):
+        with _manifest_lock:
+            self.entries = self._load()
+            self.entries[key] = {"digest": digest, "outputs": list(outputs)}
+            save_json(self.path, self.entries)
+
+    def forget(self, key):
+        with _manifest_lock:
+            self.entries = self._load()
+            if self.entries.pop(key, None) is not None:
+                save_json(self.path, self.entries)
+
+
+# --- Reference store ---
+def reference_store():
+    from reference_store import get_store
+    return get_store()
+
+
+def stored_engines(article_base, keyword_group, engines):
+    # Engines with references for this article and group. A references_raw JSON file written
+    # before the store existed is imported on first use; "merged" is deduplicated from the
+    # stored sources if it is missing.
+    store = reference_store()
+    found = []
+    for engine in engines:
+        if not store.has(article_base, keyword_group, engine):
+            legacy_path = references_path(article_base, engine, keyword_group)
+            if os.path.exists(legacy_path):
+                store.put(article_base, keyword_group, engine, load_references(legacy_path))
+            elif engine != MERGED or not run_deduplicate(article_base, keyword_group):
+                continue
+        found.append(engine)
+    return found
+
+
+def load_engine_references(article_base, keyword_group, engine):
+    if not stored_engines(article_base, keyword_group, [engine]):
+        return None
+    return reference_store().get(article_base, keyword_group, engine)
+
+
+# --- Article-level steps (read inputs, run stage, write outputs) ---
+def run_extract_keywords(article_path, article_base, candidates="rake_yake", diversity=None, stream=False, workers=None,
+                         force=False):
+    manifest = StageManifest(article_base)
+    out_path = keywords_path(article_base)
+    digest = stage_digest("keywords", {"candidates": candidates, "diversity": diversity, "stream": stream},
+                          [article_path])
+    if not force and manifest.is_fresh("keywords", digest, [out_path]):
+        print("Keywords are up to date.")
+        return load_json(out_path)
+
+    if stream:
+        # Paragraph chunks with bounded memory, for very large texts
+        import extract_keywords as stage
+        keywords = stage.extract_all_stream(article_path, candidates, diversity, workers)
+    else:
+        with open(article_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        keywords = extract_keywords(text, candidates, diversity)
+    save_json(out_path, keywords)
+    manifest.record("keywords", digest, [out_path])
+    return keywords
+
+
+_fetch_locks = {}
+_fetch_locks_lock = threading.Lock()
+
+
+def _fetch_lock(article_base, keyword_group):
+    # Fetches of the same article and group share a journal, store rows and manifest entries,
+    # so jobs with different parameters take turns; a waiting job then reuses fresh sources
+    with _fetch_locks_lock:
+        return _fetch_locks.setdefault((article_base, keyword_group), threading.Lock())
+
+
+def run_fetch_references(article_base, keyword_group, sources=SOURCES, max_results=2, batch_size=1, enrich=False,
+                         budget=None, on_result=None, force=False):
+    with _fetch_lock(article_base, keyword_group):
+        return _fetch_references(article_base, keyword_group, sources, max_results, batch_size, enrich, budget,
+                                 on_result, force)
+
+
+def _fetch_references(article_base, keyword_group, sources, max_results, batch_size, enrich, budget, on_result,
+                      force):
+    keyword_data = load_json(keywords_path(article_base))
+    keywords = keyword_data.get(keyword_group, [])
+    if not keywords:
+        print(f"No keywords found under '{keyword_group}' key in JSON.")
+        return {}
+
+    # Only this group's keywords count, so re-extracting leaves sources of unchanged groups alone
+    manifest = StageManifest(article_base)
+    params = {"keywords": keywords, "max_results": max_results, "batch_size": batch_size, "enrich": enrich}
+    digests = {source: stage_digest("references", {**params, "source": source}) for source in sources}
+    results = {}
+    stale = []
+    fresh = stored_engines(article_base, keyword_group, sources)
+    for source in sources:
+        if not force and source in fresh and manifest.is_fresh(f"references:{keyword_group}:{source}",
+                                                               digests[source], []):
+            results[source] = reference_store().get(article_base, keyword_group, source)
+            if on_result is not None:
+                on_result(source, results[source])
+        else:
+            stale.append(source)
+    if not stale:
+        print(f"References for '{keyword_group}' are up to date.")
+        return results
+
+    # All keyword/source pairs run concurrently and are checkpointed, so an interrupted
+    # fetch resumes where it stopped; each source is stored in one transaction once complete.
+    # The journal is keyed on all requested sources, not just the stale ones (which shrink as
+    # sources complete); fetch_all only restores the pairs of the sources it is given.
+    journal = FetchJournal(
+        fetch_journal_path(article_base, keyword_group),
+        {"keywords": keywords, "sources": list(sources), "max_results": max_results, "batch_size": batch_size},
+    )
+    fetched = fetch_all_references(keywords, stale, max_results, batch_size, enrich, budget, on_result, journal)
+    for source, refs in fetched.items():
+        key = f"references:{keyword_group}:{source}"
+        reference_store().put(article_base, keyword_group, source, refs)
+        if META_KEY in refs:
+            # Incomplete results are kept but fetched again next time
+            manifest.forget(key)
+        else:
+            manifest.record(key, digests[source], [])
+    if not any(META_KEY in refs for refs in fetched.values()):
+        journal.remove()
+    results.update(fetched)
+    return results
+
+
+def run_deduplicate(article_base, keyword_group, sources=SOURCES, force=False):
+    # Merges the stored sources into the "merged" engine of the reference store
+    store = reference_store()
+    found = stored_engines(article_base, keyword_group, sources)
+    if not found:
+        return {}
+    manifest = StageManifest(article_base)
+    key = f"dedup:{keyword_group}"
+    digest = stage_digest("dedup", {"sources": found},
+                          digests=[store.digest(article_base, keyword_group, source) for source in found])
+    if not force and manifest.is_fresh(key, digest, []) and store.has(article_base, keyword_group, MERGED):
+        return store.get(article_base, keyword_group, MERGED)
+
+    keywords = load_json(keywords_path(article_base)).get(keyword_group, [])
+    merged = deduplicate({source: store.get(article_base, keyword_group, source) for source in found}, keywords)
+    store.put(article_base, keyword_group, MERGED, merged)
+    manifest.record(key, digest, [])
+    return merged
+
+
+def run_diagrams(article_base, keyword_group, sources=OUTPUT_ENGINES, force=False):
+    store = reference_store()
+    manifest = StageManifest(article_base)
+    written = {}
+    for source in stored_engines(article_base, keyword_group, sources):
+        out_path = diagram_path(article_base, source, keyword_group)
+        key = f"diagram:{keyword_group}:{source}"
+        digest = stage_digest("diagram", {}, digests=[store.digest(article_base, keyword_group, source)])
+        if force or not manifest.is_fresh(key, digest, [out_path]):
+            plot_references(store.get(article_base, keyword_group, source), out_path)
+            manifest.record(key, digest, [out_path])
+        written[source] = out_path
+    return written
+
+
+def run_format_citations(article_base, keyword_group, engines=OUTPUT_ENGINES, styles=CITATION_FORMATS,
+                         force=False):
+    import format_citations as stage
+    os.makedirs("citations_formatted", exist_ok=True)
+    store = reference_store()
+    manifest = StageManifest(article_base)
+    found = stored_engines(article_base, keyword_group, engines)
+    formatted_files = {}
+    for engine in engines:
+        prefix = citations_prefix(article_base, engine, keyword_group)
+        if engine in found:
+            # Tracked per style: adding a format only renders that format
+            pending = {}
+            for style in styles:
+                digest = stage_digest("citations", {"style": style},
+                                      digests=[store.digest(article_base, keyword_group, engine)])
+                key = f"citations:{keyword_group}:{engine}:{style}"
+                if force or not manifest.is_fresh(key, digest, [f"{prefix}_{style}.txt"]):
+                    pending[style] = (key, digest)
+            if pending:
+                # One pass renders every pending style straight into its file
+                stage.stream_citations(store.iter_references(article_base, keyword_group, engine), prefix,
+                                       list(pending))
+                for style, (key, digest) in pending.items():
+                    manifest.record(key, digest, [f"{prefix}_{style}.txt"])
+        formatted_files[engine] = {style: f"{prefix}_{style}.txt" for style in styles}
+    return formatted_files
+
+
+def run_export_bibtex(article_base, keyword_group, engines=OUTPUT_ENGINES, force=False, library=None):
+    # library: a consolidated .bib shared by many articles; only papers it does not list yet are appended
+    import json_to_bibtex as stage
+    os.makedirs("citations_formatted", exist_ok=True)
+    store = reference_store()
+    manifest = StageManifest(article_base)
+    written = {}
+    for engine in stored_engines(article_base, keyword_group, engines):
+        out_path = bibtex_path(article_base, engine, keyword_group)
+        key = f"bibtex:{keyword_group}:{engine}"
+        references_digest = store.digest(article_base, keyword_group, engine)
+        digest = stage_digest("bibtex", {"keys": "author-year-title"}, digests=[references_digest])
+        if force or not manifest.is_fresh(key, digest, [out_path]):
+            stage.write_bibtex(store.iter_references(article_base, keyword_group, engine), out_path)
+            manifest.record(key, digest, [out_path])
+        written[engine] = out_path
+
+        if library is not None:
+            key = f"library:{keyword_group}:{engine}"
+            digest = stage_digest("library", {"path": os.path.abspath(library)}, digests=[references_digest])
+            if force or not manifest.is_fresh(key, digest, [library]):
+                added = stage.write_bibtex(store.iter_references(article_base, keyword_group, engine), library,
+                                           merge=True)
+                print(f"{added} new BibTeX entries added to {library}")
+                manifest.record(key, digest, [library])
+    return written
+
+
+def run_pipeline_graph(article_path, article_base, force=False):
+    import generate_pipeline_graph as stage
+    manifest = StageManifest(article_base)
+    out_path = pipeline_diagram_path(article_base)
+    store = reference_store()
+    digest = stage_digest(
+        "pipeline_graph", {}, [article_path, keywords_path(article_base)],
+        [store.digest(article_base, group, source)
+         for group in KEYWORD_GROUPS for source in stored_engines(article_base, group, SOURCES)],
+    )
+    if not force and manifest.is_fresh("pipeline_graph", digest, [out_path]):
+        return out_path
+    keywords_data, references = stage.load_pipeline_data(article_base)
+    plot_pipeline(article_path, out_path, keywords_data, references)
+    manifest.record("pipeline_graph", digest, [out_path])
+    return out_path
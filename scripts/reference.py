@@ -0,0 +1,94 @@
+import re
+
+# One normalized shape for references from every source. Built once, at fetch time
+# (or when an older file is loaded), so downstream scripts never re-detect field layouts.
+
+DOI_PREFIXES = ("https://doi.org/", "http://doi.org/", "https://dx.doi.org/", "http://dx.doi.org/", "doi:")
+
+_YEAR_RE = re.compile(r"\d{4}")
+
+
+def normalize_doi(doi):
+    if not doi:
+        return None
+    doi = str(doi).strip().lower()
+    for prefix in DOI_PREFIXES:
+        if doi.startswith(prefix):
+            doi = doi[len(prefix):]
+    return doi or None
+
+
+def parse_year(year):
+    if isinstance(year, int):
+        return year
+    match = _YEAR_RE.search(str(year)) if year else None
+    return int(match.group()) if match else None
+
+
+def parse_authors(authors):
+    # "A. Smith, B. Jones" | ["A. Smith", ...] | [{"name": ...}] | [{"given": ..., "family": ...}]
+    if not authors:
+        return ()
+    if isinstance(authors, str):
+        return tuple(name.strip() for name in authors.split(",") if name.strip())
+    names = []
+    for author in authors:
+        if isinstance(author, dict):
+            name = author.get("name") or f"{author.get('given', '')} {author.get('family', '')}".strip()
+        else:
+            name = author
+        if name:
+            names.append(str(name).strip())
+    return tuple(names)
+
+
+class Reference:
+    __slots__ = ("title", "authors", "year", "journal", "doi", "url", "abstract", "source", "provenance")
+
+    def __init__(self, title=None, authors=(), year=None, journal=None, doi=None, url=None, abstract=None,
+                 source=None, provenance=()):
+        self.title = title or None
+        self.authors = parse_authors(authors)
+        self.year = parse_year(year)
+        self.journal = journal or None
+        self.doi = normalize_doi(doi)
+        self.url = url or None
+        self.abstract = abstract or None
+        self.source = source
+        # (source, keyword) pairs a deduplicated record was merged from
+        self.provenance = tuple((p["source"], p["keyword"]) if isinstance(p, dict) else tuple(p) for p in provenance)
+
+    @classmethod
+    def from_dict(cls, data):
+        # Also reads the per-source layouts written before this type existed
+        if isinstance(data, cls):
+            return data
+        return cls(
+            title=data.get("title"),
+            authors=data.get("authors") or data.get("author"),
+            year=data.get("year") or data.get("publicationYear"),
+            journal=data.get("journal") or data.get("venue"),
+            doi=data.get("doi") or (data.get("externalIds") or {}).get("DOI"),
+            url=data.get("url"),
+            abstract=data.get("abstract"),
+            source=data.get("source"),
+            provenance=data.get("provenance") or (),
+        )
+
+    def to_dict(self):
+        # Empty fields are left out to keep reference files small
+        data = {"title": self.title, "authors": list(self.authors), "year": self.year, "journal": self.journal,
+                "doi": self.doi, "url": self.url, "abstract": self.abstract, "source": self.source,
+                "provenance": [{"source": source, "keyword": kw} for source, kw in self.provenance]}
+        return {key: value for key, value in data.items() if value}
+
+    def author_string(self, separator=", "):
+        return separator.join(self.authors)
+
+    def __eq__(self, other):
+        if not isinstance(other, Reference):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"Reference(title={self.title!r}, authors={len(self.authors)}, year={self.year}, doi={self.doi!r})"
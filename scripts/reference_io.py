@@ -0,0 +1,251 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from reference import Reference
+
+# Reserved top-level key in {keyword: [refs]} files, e.g. {"_meta": {"incomplete": [...]}}
+META_KEY = "_meta"
+
+# Newline-delimited references: one {"keyword": ..., <reference fields>} line per reference,
+# then an optional {"_meta": ...} line and a closing {"_end": true} line
+NDJSON_SUFFIX = ".ndjson"
+END_KEY = "_end"
+
+
+def load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def to_json(obj):
+    # json.dump default= hook: Reference objects are written as plain dicts
+    if isinstance(obj, Reference):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def as_references(references_raw):
+    # {keyword: [dict]} (any source layout) -> {keyword: [Reference]}; the metadata entry is kept
+    return {kw: refs if kw == META_KEY else [Reference.from_dict(ref) for ref in refs]
+            for kw, refs in references_raw.items()}
+
+
+def load_references(path):
+    if path.endswith(NDJSON_SUFFIX):
+        return load_ndjson_references(path)
+    return as_references(load_json(path))
+
+
+def save_references(path, references_raw):
+    # {keyword: [refs]} as JSON, or as NDJSON for a .ndjson path
+    if not path.endswith(NDJSON_SUFFIX):
+        save_json(path, references_raw)
+        return
+    writer = NDJSONReferenceWriter(path)
+    writer.write({kw: refs for kw, refs in keyword_items(references_raw)})
+    writer.close(references_raw.get(META_KEY))
+
+
+class NDJSONReferenceWriter:
+    # Appends references as they arrive, one line each, flushed per batch so readers in
+    # follow mode see them right away. close() writes the end marker.
+    def __init__(self, path):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.path = path
+        self.keywords = set()
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, keyword_to_refs):
+        lines = []
+        for kw, refs in keyword_to_refs.items():
+            self.keywords.add(kw)
+            for ref in refs:
+                lines.append(json.dumps({"keyword": kw, **Reference.from_dict(ref).to_dict()}, ensure_ascii=False))
+        with self._lock:
+            self._file.write("".join(line + "\n" for line in lines))
+            self._file.flush()
+
+    def close(self, meta=None):
+        with self._lock:
+            if self._file is None:
+                return
+            if meta:
+                self._file.write(json.dumps({META_KEY: meta}, ensure_ascii=False) + "\n")
+            self._file.write(json.dumps({END_KEY: True}) + "\n")
+            self._file.close()
+            self._file = None
+
+
+def iter_ndjson_records(path, follow=False, poll_interval=0.5, idle_timeout=None):
+    # Yields the parsed lines of an NDJSON references file. With follow, waits for a writer
+    # that is still appending until the end marker appears (or nothing arrives for idle_timeout seconds,
+    # counting the wait for the file to be created).
+    last_data = time.monotonic()
+    while follow and not os.path.exists(path):
+        if idle_timeout is not None and time.monotonic() - last_data > idle_timeout:
+            raise TimeoutError(f"{path} was not created within {idle_timeout}s")
+        time.sleep(poll_interval)
+    with open(path, "r", encoding="utf-8") as f:
+        last_data = time.monotonic()
+        while True:
+            position = f.tell()
+            line = f.readline()
+            if line.endswith("\n"):
+                last_data = time.monotonic()
+                record = json.loads(line)
+                if END_KEY in record:
+                    return
+                yield record
+            elif not follow:
+                if line.strip():
+                    yield json.loads(line)  # written by hand, without a trailing newline
+                return
+            else:
+                # Nothing new yet, or half a line: wait for the writer
+                if idle_timeout is not None and time.monotonic() - last_data > idle_timeout:
+                    raise TimeoutError(f"No new references in {path} for {idle_timeout}s")
+                f.seek(position)
+                time.sleep(poll_interval)
+
+
+def iter_ndjson_references(path, follow=False, poll_interval=0.5, idle_timeout=None):
+    # (keyword, Reference) pairs in the order they were written
+    for record in iter_ndjson_records(path, follow, poll_interval, idle_timeout):
+        if META_KEY not in record:
+            yield record.get("keyword"), Reference.from_dict(record)
+
+
+def load_ndjson_references(path):
+    references = {}
+    for record in iter_ndjson_records(path):
+        if META_KEY in record:
+            references[META_KEY] = record[META_KEY]
+        else:
+            references.setdefault(record.get("keyword"), []).append(Reference.from_dict(record))
+    return references
+
+
+def iter_reference_file(path, follow=False):
+    # Every Reference in a JSON or NDJSON references file; NDJSON is read incrementally
+    if path.endswith(NDJSON_SUFFIX):
+        for _, ref in iter_ndjson_references(path, follow):
+            yield ref
+    else:
+        yield from (Reference.from_dict(ref) for ref in flatten_references(load_json(path)))
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    # Yields a temp file path in the same directory, renamed over path once the block succeeds:
+    # readers (other sessions, other workers) never see a partial file
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=parent or ".", prefix=".tmp-", suffix=os.path.splitext(path)[1])
+    os.close(fd)
+    try:
+        yield tmp_path
+        # mkstemp files are private; keep the mode of the file being replaced
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_json(path, data):
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False, default=to_json)
+
+
+def keyword_items(references_raw):
+    # (keyword, refs) pairs of a grouped references dict, skipping the metadata entry
+    return [(kw, refs) for kw, refs in references_raw.items() if kw != META_KEY]
+
+
+def flatten_references(references_raw):
+    # Flatten if the JSON is grouped by keywords (dict of lists)
+    if isinstance(references_raw, dict):
+        references = []
+        for _, refs_list in keyword_items(references_raw):
+            references.extend(refs_list)
+        return references
+    return references_raw
+
+
+def incomplete_keywords(references_raw):
+    # Keywords that ran out of latency budget or whose request failed
+    if isinstance(references_raw, dict):
+        meta = references_raw.get(META_KEY, {})
+        return meta.get("incomplete", []) + meta.get("failed", [])
+    return []
+
+
+class FetchJournal:
+    # Append-only JSONL checkpoint of finished keyword/source pairs, so a rerun only
+    # fetches what is missing. The first line records the fetch parameters; a journal
+    # written with different parameters is discarded.
+    def __init__(self, path, params):
+        self.path = path
+        self.params = json.loads(json.dumps(params))  # compare as it round-trips through the file
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except ValueError:
+            header = {}
+        if header.get("params") != self.params:
+            os.remove(self.path)
+            return done
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # torn last line from a crash
+            done[(record["source"], record["keyword"])] = [Reference.from_dict(ref) for ref in record["refs"]]
+        return done
+
+    def record(self, source, keyword_to_refs):
+        with self._lock:
+            if self._file is None:
+                new = not os.path.exists(self.path)
+                parent = os.path.dirname(self.path)
+                if parent:
+                    os.makedirs(parent, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+                if new:
+                    self._write({"params": self.params})
+            for kw, refs in keyword_to_refs.items():
+                self._write({"source": source, "keyword": kw, "refs": refs})
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=to_json) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+from reference import Reference
+from reference_io import META_KEY, keyword_items, to_json
+
+# One SQLite file for the references of every article, keyword group and source, instead of a
+# JSON file per (article, source, group). Each keyword's references are one zlib-compressed row,
+# indexed on (article, grp, source, keyword); titles are kept uncompressed for cheap graph queries.
+DEFAULT_STORE_PATH = "references_raw/references.sqlite"
+COMPRESSION_LEVEL = 6
+
+
+def _pack(refs):
+    return zlib.compress(json.dumps(refs, ensure_ascii=False, default=to_json).encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def _unpack(payload):
+    return [Reference.from_dict(ref) for ref in json.loads(zlib.decompress(payload).decode("utf-8"))]
+
+
+class ReferenceStore:
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS refs ("
+            " article TEXT, grp TEXT, source TEXT, keyword TEXT, position INTEGER,"
+            " titles TEXT, payload BLOB)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS refs_key ON refs(article, grp, source, keyword)")
+        # One row per stored (article, grp, source): content digest and the _meta entry, if any
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " article TEXT, grp TEXT, source TEXT, digest TEXT, meta TEXT,"
+            " PRIMARY KEY (article, grp, source))"
+        )
+        self._conn.commit()
+
+    def put(self, article, group, source, keyword_to_refs):
+        # Replaces everything stored for (article, group, source) in one transaction
+        rows = []
+        digest = hashlib.sha256()
+        for position, (keyword, refs) in enumerate(keyword_items(keyword_to_refs)):
+            refs = [Reference.from_dict(ref) for ref in refs]
+            payload = _pack(refs)
+            digest.update(keyword.encode("utf-8") + b"\0" + payload)
+            titles = json.dumps([ref.title for ref in refs], ensure_ascii=False)
+            rows.append((article, group, source, keyword, position, titles, payload))
+        meta = keyword_to_refs.get(META_KEY)
+        meta = json.dumps(meta) if meta else None
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM refs WHERE article = ? AND grp = ? AND source = ?",
+                               (article, group, source))
+            self._conn.executemany("INSERT INTO refs VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                               (article, group, source, digest.hexdigest(), meta))
+
+    def get(self, article, group, source, keywords=None):
+        # {keyword: [Reference]} (plus META_KEY when incomplete), or None if nothing is stored
+        meta = self._entry(article, group, source)
+        if meta is None:
+            return None
+        query = "SELECT keyword, payload FROM refs WHERE article = ? AND grp = ? AND source = ?"
+        params = [article, group, source]
+        if keywords is not None:
+            query += f" AND keyword IN ({','.join('?' * len(keywords))})"
+            params += list(keywords)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY position", params).fetchall()
+        result = {keyword: _unpack(payload) for keyword, payload in rows}
+        if meta[1]:
+            result[META_KEY] = json.loads(meta[1])
+        return result
+
+    def iter_references(self, article, group, source):
+        # One keyword row in memory at a time: rows are fetched from the cursor as the caller
+        # consumes them, on a connection of their own so the shared one stays free meanwhile
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            rows = conn.execute(
+                "SELECT payload FROM refs WHERE article = ? AND grp = ? AND source = ? ORDER BY position",
+                (article, group, source),
+            )
+            for (payload,) in rows:
+                yield from _unpack(payload)
+        finally:
+            conn.close()
+
+    def titles(self, article, group=None):
+        # {group: {source: {keyword: [title]}}} without decompressing any payload
+        query = "SELECT grp, source, keyword, titles FROM refs WHERE article = ?"
+        params = [article]
+        if group is not None:
+            query += " AND grp = ?"
+            params.append(group)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY grp, source, position", params).fetchall()
+        result = {}
+        for grp, source, keyword, titles in rows:
+            result.setdefault(grp, {}).setdefault(source, {})[keyword] = json.loads(titles)
+        return result
+
+    def _entry(self, article, group, source):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT digest, meta FROM entries WHERE article = ? AND grp = ? AND source = ?",
+                (article, group, source),
+            ).fetchone()
+
+    def has(self, article, group, source):
+        return self._entry(article, group, source) is not None
+
+    def digest(self, article, group, source):
+        entry = self._entry(article, group, source)
+        return entry[0] if entry else None
+
+    def delete(self, article, group=None, source=None):
+        where, params = "article = ?", [article]
+        if group is not None:
+            where += " AND grp = ?"
+            params.append(group)
+        if source is not None:
+            where += " AND source = ?"
+            params.append(source)
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM refs WHERE {where}", params)
+            self._conn.execute(f"DELETE FROM entries WHERE {where}", params)
+
+    def stats(self):
+        with self._lock:
+            entries, articles = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT article) FROM entries").fetchone()
+            rows, payload_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM refs").fetchone()
+        return {"articles": articles, "entries": entries, "keyword_rows": rows, "payload_bytes": payload_bytes}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    # Location configurable with REFERENCE_STORE_PATH
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ReferenceStore(os.environ.get("REFERENCE_STORE_PATH", DEFAULT_STORE_PATH))
+        return _store
+
+
+if __name__ == "__main__":
+    import sys
+    from reference_io import load_references, save_references
+
+    usage = ("Usage: python reference_store.py import <article> <group> <source> <references_json_or_ndjson_file>\n"
+             "       python reference_store.py export <article> <group> <source> <output_json_or_ndjson_file>")
+    if len(sys.argv) != 6 or sys.argv[1] not in ("import", "export"):
+        print(usage)
+        sys.exit(1)
+
+    command, article, group, source, path = sys.argv[1:]
+    store = get_store()
+    if command == "import":
+        store.put(article, group, source, load_references(path))
+        print(f"Imported {path} into {store.path}")
+    else:
+        refs = store.get(article, group, source)
+        if refs is None:
+            print(f"No references stored for {article}/{group}/{source}")
+            sys.exit(1)
+        save_references(path, refs)
+        print(f"Exported {article}/{group}/{source} to {path}")
+
+# python scripts/reference_store.py export article_1 rake openalex references_raw/article_1_references_openalex_rake.json
@@ -0,0 +1,40 @@
+import hashlib
+import json
+import os
+
+from reference_io import atomic_path
+
+# Workspaces for the app. Every pipeline output (keywords, reference store rows, citations,
+# diagrams, manifest) is named after the article_base it was computed for, so keying
+# article_base on the article's file name and the settings its outputs depend on gives:
+# sessions working on the same article with the same settings share one workspace and reuse
+# each other's results; different settings never touch them. The key is deliberately not the
+# article's content: an edited article keeps its workspace, and the stage manifest's content
+# hashes decide which steps rerun (a keyword group whose keywords are unchanged is not refetched).
+UPLOADS_DIR = "workspaces/uploads"
+KEY_LENGTH = 12
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def save_upload(filename, data):
+    # Content-addressed: uploads never overwrite articles/ or each other, and the same bytes
+    # uploaded twice (by any session) are stored once
+    path = os.path.join(UPLOADS_DIR, content_digest(data)[:16], os.path.basename(filename))
+    if not os.path.exists(path):
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+    return path
+
+
+def workspace_name(article_path, settings=None):
+    # "<file stem>-<hash of file name and settings>", used as the pipeline's article_base.
+    # An upload is named after its original file name (save_upload keeps it).
+    filename = os.path.basename(article_path)
+    raw = json.dumps([filename, settings or {}], sort_keys=True)
+    key = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:KEY_LENGTH]
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}-{key}"
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The scripts import each other by module name, as when run from scripts/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import reference_store  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Pipeline paths are relative to the working directory; the reference store is per process
+    monkeypatch.chdir(tmp_path)
+    for directory in ("keywords", "references_raw", "diagrams", "citations_formatted"):
+        os.makedirs(directory)
+    monkeypatch.setattr(reference_store, "_store", reference_store.ReferenceStore(str(tmp_path / "store.sqlite")))
+    return tmp_path
@@ -0,0 +1,78 @@
+import json
+import os
+
+from json_to_bibtex import INDEX_SUFFIX, citation_key, references_to_bibtex, scan_bibtex, write_bibtex
+from reference import Reference
+
+LECUN = dict(title="Deep learning", authors=["LeCun, Yann", "Yoshua Bengio"], year=2015)
+DOI = "10.1038/nature14539"
+
+
+def keys(bib_file):
+    return sorted(scan_bibtex(bib_file).keys)
+
+
+def test_citation_keys_come_from_the_content():
+    assert citation_key(Reference(**LECUN)) == "lecun2015deep"
+    assert citation_key(Reference(title="The Élan of Ünïcode", authors=["Zoë Ñúñez"])) == "nunezndelan"
+    assert citation_key(Reference()) == "anonnd"
+
+
+def test_escaping_and_clashing_keys():
+    bib = references_to_bibtex([
+        Reference(**LECUN, journal="Nature & Co", doi=DOI),
+        Reference(title="Deep learning 100% of the time", authors=["Ann LeCun"], year=2015),
+    ])
+    assert "journal = {Nature \\& Co}" in bib
+    assert "title = {Deep learning 100\\% of the time}" in bib
+    assert "@article{lecun2015deep," in bib and "@article{lecun2015deepa," in bib
+
+
+def test_same_paper_with_and_without_doi_is_listed_once():
+    bib = references_to_bibtex([Reference(**LECUN), Reference(**LECUN, doi=DOI), Reference(**LECUN, doi=DOI)])
+    assert bib.count("@article") == 1
+
+    bib = references_to_bibtex([Reference(**LECUN, doi=DOI), Reference(**{**LECUN, "title": "Deep Learning."})])
+    assert bib.count("@article") == 1
+
+
+def test_same_title_with_different_dois_are_two_papers():
+    bib = references_to_bibtex([Reference(title="Editorial notes", year=2020, doi="10.1/a"),
+                                Reference(title="Editorial notes", year=2020, doi="10.1/b"),
+                                Reference(title="Editorial notes", year=2020)])
+    assert bib.count("@article") == 2
+
+
+def test_merge_appends_only_new_papers(tmp_path):
+    bib_file = str(tmp_path / "library.bib")
+    assert write_bibtex([Reference(**LECUN)], bib_file, merge=True) == 1
+    # The DOI seen now is linked to the existing entry, in the sidecar too
+    assert write_bibtex([Reference(**LECUN, doi=DOI), Reference(title="Attention is all you need", year=2017,
+                                                                authors=["Ashish Vaswani"])], bib_file, merge=True) == 1
+    assert write_bibtex([Reference(title="Other title", year=2015, doi=DOI)], bib_file, merge=True) == 0
+    assert keys(bib_file) == ["lecun2015deep", "vaswani2017attention"]
+
+
+def test_merge_rebuilds_a_stale_or_old_sidecar(tmp_path):
+    bib_file = str(tmp_path / "library.bib")
+    write_bibtex([Reference(**LECUN, doi=DOI)], bib_file, merge=True)
+
+    # Edited by hand: the sidecar no longer matches and the .bib is scanned instead
+    with open(bib_file, "a", encoding="utf-8") as f:
+        f.write("@article{vaswani2017attention,\n  title = {Attention is all you need},\n  year = {2017},\n}\n\n")
+    assert write_bibtex([Reference(title="Attention Is All You Need", year=2017)], bib_file, merge=True) == 0
+
+    # A sidecar with one identity per entry is rescanned, so the title|year identity is known too
+    with open(bib_file + INDEX_SUFFIX, "w", encoding="utf-8") as f:
+        for key, end in (("lecun2015deep", 0), ("vaswani2017attention", os.path.getsize(bib_file))):
+            f.write(json.dumps([f"doi:{DOI}" if key.startswith("lecun") else None, key, end]) + "\n")
+    assert write_bibtex([Reference(**LECUN)], bib_file, merge=True) == 0
+    assert keys(bib_file) == ["lecun2015deep", "vaswani2017attention"]
+
+
+def test_write_replaces_the_file_without_merge(tmp_path):
+    bib_file = str(tmp_path / "article.bib")
+    write_bibtex([Reference(**LECUN)], bib_file)
+    write_bibtex([Reference(title="Attention is all you need", year=2017, authors=["Ashish Vaswani"])], bib_file)
+    assert keys(bib_file) == ["vaswani2017attention"]
+    assert os.listdir(tmp_path) == ["article.bib"]
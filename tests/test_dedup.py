@@ -0,0 +1,56 @@
+from dedup import MERGED_SOURCE, cluster_references, deduplicate
+from reference import Reference
+
+TITLE = "Deep learning for citation recommendation in scholarly search"
+
+
+def test_same_doi_merges_whatever_the_title():
+    refs = [Reference(title=TITLE, doi="10.1000/a1"), Reference(title="Something else", doi="https://doi.org/10.1000/A1")]
+    assert cluster_references(refs) == [0, 0]
+
+
+def test_near_identical_titles_merge():
+    refs = [
+        Reference(title=TITLE, year=2020),
+        Reference(title=TITLE.upper() + ".", year=2021, doi="10.1000/a1"),
+        Reference(title=TITLE.replace("recommendation", "recommendations"), year=2020),
+        Reference(title=TITLE, year=2015),  # same title, years too far apart
+    ]
+    assert cluster_references(refs) == [0, 0, 0, 3]
+
+
+def test_similar_titles_with_different_dois_stay_apart():
+    refs = [
+        Reference(title=f"{TITLE}, Part I", year=2020, doi="10.1000/a1"),
+        Reference(title=f"{TITLE}, Part II", year=2020, doi="10.1000/a2"),
+        Reference(title=f"{TITLE}, Part I", year=2020, doi="10.1000/a3"),
+        Reference(title=f"{TITLE}, Part II", year=2020, doi="10.1000/a4"),
+    ]
+    assert cluster_references(refs) == [0, 1, 2, 3]
+
+
+def test_a_record_without_doi_joins_only_one_doi():
+    refs = [
+        Reference(title=TITLE, year=2020, doi="10.1000/a1"),
+        Reference(title=TITLE, year=2020),
+        Reference(title=TITLE, year=2020, doi="10.1000/a2"),
+    ]
+    roots = cluster_references(refs)
+    assert roots[0] == roots[1] != roots[2]
+
+
+def test_deduplicate_keeps_every_doi_and_the_provenance():
+    by_source = {
+        "openalex": {"graphs": [Reference(title=f"{TITLE}, Part I", year=2020, doi="10.1000/a1"),
+                                Reference(title=f"{TITLE}, Part II", year=2020, doi="10.1000/a2")]},
+        "crossref": {"search": [Reference(title=f"{TITLE}, part I", year=2020, doi="10.1000/a1",
+                                          authors=["Ada Lovelace"], journal="J. Citations")]},
+    }
+    merged = deduplicate(by_source, ["graphs", "search"])
+    assert list(merged) == ["graphs", "search"] and merged["search"] == []
+    papers = {ref.doi: ref for ref in merged["graphs"]}
+    assert set(papers) == {"10.1000/a1", "10.1000/a2"}
+    first = papers["10.1000/a1"]
+    assert first.source == MERGED_SOURCE
+    assert first.journal == "J. Citations" and list(first.authors) == ["Ada Lovelace"]
+    assert list(first.provenance) == [("openalex", "graphs"), ("crossref", "search")]
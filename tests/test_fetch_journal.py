@@ -0,0 +1,70 @@
+import json
+import os
+
+import fetch_references
+from reference import Reference
+from reference_io import META_KEY, FetchJournal
+
+PARAMS = {"keywords": ["graphs", "citations"], "sources": ["openalex", "crossref"], "max_results": 2}
+
+
+def test_finished_pairs_are_restored(tmp_path):
+    path = str(tmp_path / "run.journal")
+    journal = FetchJournal(path, PARAMS)
+    journal.record("openalex", {"graphs": [Reference(title="Graphs", year=2020)]})
+    journal.record("crossref", {"citations": []})
+    journal.close()
+
+    done = FetchJournal(path, PARAMS).load()
+    assert done == {("openalex", "graphs"): [Reference(title="Graphs", year=2020)], ("crossref", "citations"): []}
+
+
+def test_a_journal_with_other_params_is_discarded(tmp_path):
+    path = str(tmp_path / "run.journal")
+    journal = FetchJournal(path, PARAMS)
+    journal.record("openalex", {"graphs": []})
+    journal.close()
+
+    assert FetchJournal(path, {**PARAMS, "max_results": 5}).load() == {}
+    assert not os.path.exists(path)
+
+
+def test_a_torn_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "run.journal")
+    journal = FetchJournal(path, PARAMS)
+    journal.record("openalex", {"graphs": [], "citations": []})
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"source": "crossref", "keyword": "graphs", "refs": []})[:20])
+
+    assert set(FetchJournal(path, PARAMS).load()) == {("openalex", "graphs"), ("openalex", "citations")}
+
+
+def test_fetch_all_resumes_where_it_stopped(tmp_path, monkeypatch):
+    calls = []
+    failing = {("crossref", "citations")}
+
+    def search(source, kws, max_results):
+        calls.append((source, kws[0]))
+        if (source, kws[0]) in failing:
+            raise RuntimeError("service unavailable")
+        return {kws[0]: [Reference(title=f"{source} {kws[0]}")]}
+
+    monkeypatch.setattr(fetch_references, "_search_task", search)
+    path = str(tmp_path / "run.journal")
+
+    first = fetch_references.fetch_all(PARAMS["keywords"], PARAMS["sources"], journal=FetchJournal(path, PARAMS))
+    assert first["crossref"][META_KEY] == {"failed": ["citations"]}
+    assert len(calls) == 4
+
+    calls.clear()
+    failing.clear()
+    second = fetch_references.fetch_all(PARAMS["keywords"], PARAMS["sources"], journal=FetchJournal(path, PARAMS))
+    assert calls == [("crossref", "citations")]
+    assert META_KEY not in second["crossref"]
+    assert second["openalex"]["graphs"] == [Reference(title="openalex graphs")]
+
+    # A subset of the sources restores only its own pairs
+    calls.clear()
+    third = fetch_references.fetch_all(PARAMS["keywords"], ["openalex"], journal=FetchJournal(path, PARAMS))
+    assert calls == [] and list(third) == ["openalex"]
@@ -0,0 +1,56 @@
+import pytest
+
+import fetch_references
+from fetch_references import OPENALEX_PAGE_SIZE, query_openalex
+
+KEYWORDS = ["graph neural network", "citation recommendation", "topic model", "query expansion", "entity linking"]
+
+
+@pytest.fixture
+def openalex(monkeypatch):
+    # A fake /works endpoint over a corpus whose keywords appear only in the abstracts, interleaved
+    works = [
+        {"id": f"W{i}", "title": f"Study {i}", "publication_year": 2020,
+         "abstract_inverted_index": {word: [pos] for pos, word in enumerate(f"we study {kw} at scale".split())}}
+        for i, kw in enumerate(KEYWORDS * 300)
+    ]
+    calls = []
+
+    def get_json(source, url, params, query):
+        calls.append(params)
+        if "filter" in params:
+            terms = params["filter"].split(":", 1)[1].split("|")
+        else:
+            terms = [params["search"]]
+        hits = [work for work in works
+                if any(set(term.split()) <= set(work["abstract_inverted_index"]) for term in terms)]
+        start = 0 if params["cursor"] == "*" else int(params["cursor"])
+        end = start + params["per_page"]
+        page = [{key: value for key, value in work.items()
+                 if key in params["select"].split(",")} for work in hits[start:end]]
+        return 200, {"results": page, "meta": {"next_cursor": str(end) if end < len(hits) else None}}
+
+    monkeypatch.setattr(fetch_references, "get_json", get_json)
+    return calls
+
+
+@pytest.mark.parametrize("max_results", [2, 50, 150, 250])
+def test_batching_never_costs_more_requests(openalex, max_results):
+    unbatched = query_openalex(KEYWORDS, max_results)
+    unbatched_calls = len(openalex)
+    openalex.clear()
+
+    batched = query_openalex(KEYWORDS, max_results, batch_size=5)
+    assert len(openalex) <= unbatched_calls
+    if max_results * len(KEYWORDS) <= OPENALEX_PAGE_SIZE:
+        assert len(openalex) == 1
+    for kw in KEYWORDS:
+        assert len(batched[kw]) == len(unbatched[kw]) == max_results
+        assert all(kw in ref.abstract for ref in batched[kw])
+
+
+def test_keywords_keep_their_hits_when_the_batch_runs_out(openalex):
+    batched = query_openalex(KEYWORDS, 400, batch_size=5)
+    # 1500 hits in all: eight pages, no searches per keyword
+    assert len(openalex) == 8
+    assert all(len(batched[kw]) == 300 for kw in KEYWORDS)
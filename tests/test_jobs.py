@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+import pytest
+
+import fetch_references
+import pipeline
+import reference_store
+from jobs import DONE, FAILED, MAX_JOB_ITEMS, JobRunner
+from reference import Reference
+from reference_io import save_json
+
+
+def wait(job, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job.active:
+        assert time.monotonic() < deadline, f"{job.id} still {job.status}"
+        time.sleep(0.01)
+    return job.snapshot()
+
+
+@pytest.fixture
+def stub_search(monkeypatch):
+    # Stands in for the search APIs: one reference per keyword and result, tracking concurrency
+    state = {"calls": [], "active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def search(source, kws, max_results):
+        with lock:
+            state["calls"].append((source, tuple(kws)))
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.02)
+        with lock:
+            state["active"] -= 1
+        return {kw: [Reference(title=f"{source} {kw} {i}", year=2020) for i in range(max_results)] for kw in kws}
+
+    monkeypatch.setattr(fetch_references, "_search_task", search)
+    return state
+def test_same_request_shares_one_job():
+    runner = JobRunner(2)
+    release = threading.Event()
+    first = runner.submit("a", "fetch", lambda job: release.wait(5), params={"group": "rake"})
+    again = runner.submit("a", "fetch", lambda job: release.wait(5), params={"group": "rake"})
+    other = runner.submit("a", "fetch", lambda job: release.wait(5), params={"group": "yake"})
+    assert again is first
+    assert other is not first
+    release.set()
+    wait(first)
+    wait(other)
+    # Once finished, the same request starts a new job
+    assert runner.submit("a", "fetch", lambda job: None, params={"group": "rake"}) is not first
+
+
+def test_jobs_queue_behind_the_pool_and_report_failures():
+    runner = JobRunner(1)
+    release = threading.Event()
+    running = runner.submit("a", "keywords", lambda job: release.wait(5))
+    queued = runner.submit("a", "bibtex", lambda job: 1 / 0)
+    time.sleep(0.05)
+    assert runner.stats()["queued"] == 1
+    release.set()
+    assert wait(running)["status"] == DONE
+    failed = wait(queued)
+    assert failed["status"] == FAILED
+    assert failed["error"].startswith("ZeroDivisionError")
+
+
+def test_progress_and_items_are_visible_while_running():
+    runner = JobRunner(1)
+    step, release = threading.Event(), threading.Event()
+
+    def fn(job):
+        job.update(progress=0.5, message="half", items=["first"])
+        step.set()
+        release.wait(5)
+        return "ok"
+
+    job = runner.submit("a", "fetch", fn)
+    assert step.wait(5)
+    snapshot = job.snapshot()
+    assert (snapshot["status"], snapshot["progress"], snapshot["message"], snapshot["items"]) == \
+        ("running", 0.5, "half", ["first"])
+    release.set()
+    snapshot = wait(job)
+    assert (snapshot["progress"], snapshot["result"]) == (1.0, "ok")
+    assert runner.jobs("a") == [job] and runner.jobs("b") == []
+
+
+def test_partial_items_are_capped():
+    runner = JobRunner(1)
+
+    def fn(job):
+        for i in range(MAX_JOB_ITEMS * 3):
+            job.update(items=[f"item {i}"])
+
+    items = wait(runner.submit("a", "fetch", fn))["items"]
+    assert len(items) == MAX_JOB_ITEMS
+    assert items[-1] == f"item {MAX_JOB_ITEMS * 3 - 1}"
+
+
+def test_fetch_jobs_of_one_article_and_group_take_turns(workdir, stub_search):
+    save_json(pipeline.keywords_path("art"), {"rake": ["graphs", "citations"]})
+    runner = JobRunner(4)
+    progress = []
+
+    def fetch_job(job, max_results):
+        on_result = lambda source, found: progress.append((max_results, source))
+        return pipeline.run_fetch_references("art", "rake", max_results=max_results, on_result=on_result, force=True)
+
+    small = runner.submit("art", "fetch", fetch_job, 1, params={"max_results": 1})
+    large = runner.submit("art", "fetch", fetch_job, 2, params={"max_results": 2})
+    assert wait(small)["status"] == DONE and wait(large)["status"] == DONE
+
+    # Never more searches in flight than one fetch issues, and each fetch's results arrive together
+    assert stub_search["peak"] <= len(pipeline.SOURCES) * 2
+    runs = [max_results for max_results, _ in progress]
+    assert runs == sorted(runs) or runs == sorted(runs, reverse=True)
+    stored = reference_store.get_store().get("art", "rake", "openalex")
+    assert len(stored["graphs"]) == runs[-1]
+    assert not os.path.exists(pipeline.fetch_journal_path("art", "rake"))
+
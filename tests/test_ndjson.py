@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from reference import Reference
+from reference_io import (
+    META_KEY, NDJSONReferenceWriter, iter_ndjson_references, iter_reference_file, load_ndjson_references,
+    load_references, save_references,
+)
+
+GRAPHS = [Reference(title="Graph A", year=2020), Reference(title="Graph B", doi="10.1/b")]
+CITATIONS = [Reference(title="Citing C", authors=["Ann Author"])]
+
+
+def test_round_trip_with_metadata(tmp_path):
+    path = str(tmp_path / "refs.ndjson")
+    save_references(path, {"graphs": GRAPHS, "citations": CITATIONS, META_KEY: {"failed": ["trees"]}})
+    loaded = load_ndjson_references(path)
+    assert loaded == {"graphs": GRAPHS, "citations": CITATIONS, META_KEY: {"failed": ["trees"]}}
+    assert load_references(path) == loaded
+    assert list(iter_reference_file(path)) == GRAPHS + CITATIONS
+
+
+def test_a_hand_written_last_line_without_newline_is_read(tmp_path):
+    path = tmp_path / "refs.ndjson"
+    path.write_text('{"keyword": "graphs", "title": "Graph A"}\n{"keyword": "graphs", "title": "Graph B"}',
+                    encoding="utf-8")
+    assert [ref.title for _, ref in iter_ndjson_references(str(path))] == ["Graph A", "Graph B"]
+
+
+def test_follow_reads_references_as_they_are_written(tmp_path):
+    path = str(tmp_path / "refs.ndjson")
+    seen = []
+    written = threading.Event()
+
+    def read():
+        for keyword, ref in iter_ndjson_references(path, follow=True, poll_interval=0.01, idle_timeout=5):
+            seen.append((keyword, ref.title))
+            written.set()
+
+    reader = threading.Thread(target=read)
+    reader.start()  # before the file exists
+    time.sleep(0.05)
+    writer = NDJSONReferenceWriter(path)
+    writer.write({"graphs": GRAPHS[:1]})
+    assert written.wait(5)
+    assert seen == [("graphs", "Graph A")]
+    writer.write({"graphs": GRAPHS[1:], "citations": CITATIONS})
+    writer.close()
+    reader.join(5)
+    assert not reader.is_alive()
+    assert seen == [("graphs", "Graph A"), ("graphs", "Graph B"), ("citations", "Citing C")]
+
+
+def test_follow_waits_for_the_rest_of_a_half_written_line(tmp_path):
+    path = tmp_path / "refs.ndjson"
+    path.write_text('{"keyword": "graphs", "title": "Gra', encoding="utf-8")
+
+    def finish():
+        time.sleep(0.05)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('ph A"}\n{"_end": true}\n')
+
+    threading.Thread(target=finish).start()
+    assert [ref.title for _, ref in iter_ndjson_references(str(path), follow=True, poll_interval=0.01,
+                                                            idle_timeout=5)] == ["Graph A"]
+
+
+def test_follow_gives_up_after_the_idle_timeout(tmp_path):
+    path = str(tmp_path / "refs.ndjson")
+    with pytest.raises(TimeoutError):
+        list(iter_ndjson_references(path, follow=True, poll_interval=0.01, idle_timeout=0.1))
+
+    writer = NDJSONReferenceWriter(path)
+    writer.write({"graphs": GRAPHS})  # never closed
+    reader = iter_ndjson_references(path, follow=True, poll_interval=0.01, idle_timeout=0.1)
+    assert [ref for _, ref in [next(reader), next(reader)]] == GRAPHS
+    with pytest.raises(TimeoutError):
+        next(reader)
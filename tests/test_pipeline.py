@@ -0,0 +1,36 @@
+import os
+
+import pipeline
+import reference_store
+from reference import Reference
+from reference_io import save_json
+
+
+def store_sources(article_base, group):
+    save_json(pipeline.keywords_path(article_base), {group: ["graphs"]})
+    store = reference_store.get_store()
+    for source in pipeline.SOURCES:
+        store.put(article_base, group, source, {"graphs": [
+            Reference(title="Citation graphs at scale", year=2020, doi="10.1000/a1", source=source),
+            Reference(title=f"A paper only {source} found", year=2019, source=source),
+        ]})
+
+
+def test_downstream_steps_use_the_merged_references(workdir):
+    store_sources("art", "rake")
+    formatted = pipeline.run_format_citations("art", "rake")
+    written = pipeline.run_export_bibtex("art", "rake")
+
+    # "merged" is deduplicated on first use; no per-source outputs are written
+    assert list(formatted) == list(written) == [pipeline.MERGED]
+    assert sorted(os.listdir("citations_formatted")) == [
+        f"art_merged_rake{suffix}" for suffix in (".bib", "_apa.txt", "_chicago.txt", "_mla.txt")
+    ]
+    with open(written[pipeline.MERGED], encoding="utf-8") as f:
+        assert f.read().count("@article") == 1 + len(pipeline.SOURCES)
+
+
+def test_per_source_outputs_on_request(workdir):
+    store_sources("art", "rake")
+    written = pipeline.run_export_bibtex("art", "rake", engines=pipeline.ENGINES)
+    assert sorted(written) == sorted(pipeline.ENGINES)
@@ -0,0 +1,70 @@
+import pytest
+
+import fetch_references
+import response_cache
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "responses.sqlite"), ttl=60, max_entries=3)
+
+
+def test_hits_match_the_normalized_query_and_params(cache):
+    cache.set("openalex", "Deep  Learning", {"search": "Deep  Learning", "per_page": 2}, {"results": [1]})
+    assert cache.get("openalex", "deep learning", {"search": "deep learning", "per_page": 2}) == {"results": [1]}
+    assert cache.get("openalex", "deep learning", {"search": "deep learning", "per_page": 5}) is None
+    assert cache.get("crossref", "deep learning", {"search": "deep learning", "per_page": 2}) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_entries_expire_after_the_ttl(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache.set("openalex", "q", {}, [1])
+    now[0] += 59
+    assert cache.get("openalex", "q", {}) == [1]
+    now[0] += 2
+    assert cache.get("openalex", "q", {}) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    for query in ("a", "b", "c"):
+        now[0] += 1
+        cache.set("openalex", query, {}, query)
+    now[0] += 1
+    cache.get("openalex", "a", {})
+    now[0] += 1
+    cache.set("openalex", "d", {}, "d")
+    assert [cache.get("openalex", query, {}) for query in "abcd"] == ["a", None, "c", "d"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_persist_across_instances(cache):
+    cache.set("openalex", "q", {"page": 1}, {"results": []})
+    assert ResponseCache(cache.path).get("openalex", "q", {"page": 1}) == {"results": []}
+
+
+def test_get_json_only_sends_a_request_on_a_miss(cache, monkeypatch):
+    sent = []
+
+    class Response:
+        status_code = 200
+
+        def json(self):
+            return {"results": ["hit"]}
+
+    class Client:
+        def get(self, source, url, params=None):
+            sent.append(params)
+            return Response()
+
+    monkeypatch.setattr(response_cache, "_cache", cache)
+    monkeypatch.setattr(fetch_references, "get_client", lambda: Client())
+    for _ in range(3):
+        assert fetch_references.get_json("openalex", "https://api.openalex.org/works", {"search": "q"}, "q") == \
+            (200, {"results": ["hit"]})
+    assert len(sent) == 1
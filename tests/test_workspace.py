@@ -0,0 +1,28 @@
+import os
+
+from workspace import save_upload, workspace_name
+
+
+def test_uploads_are_content_addressed(workdir):
+    first = save_upload("article.txt", b"one text")
+    same = save_upload("article.txt", b"one text")
+    other = save_upload("article.txt", b"another text")
+    assert first == same
+    assert first != other
+    assert os.path.basename(other) == "article.txt"
+    with open(first, "rb") as f:
+        assert f.read() == b"one text"
+
+
+def test_workspaces_are_keyed_on_file_name_and_settings(workdir):
+    first = save_upload("article.txt", b"one text")
+    edited = save_upload("article.txt", b"one text, edited")
+    renamed = save_upload("notes.txt", b"one text")
+
+    name = workspace_name(first, {"candidates": "rake_yake"})
+    assert name.startswith("article-")
+    # An edited article keeps its workspace; the stage manifest decides what reruns
+    assert workspace_name(edited, {"candidates": "rake_yake"}) == name
+    assert workspace_name(os.path.join("articles", "article.txt"), {"candidates": "rake_yake"}) == name
+    assert workspace_name(renamed, {"candidates": "rake_yake"}) != name
+    assert workspace_name(first, {"candidates": "ngrams"}) != name